@@ -0,0 +1,87 @@
+from datetime import datetime, timezone
+
+from cloud_config import get_local_store, volume_cache, CURRENT_QUARTER_TTL
+from tracing import record_cosmos_page, record_request_charge
+
+# Cosmos SQL expressions matching LocalChatStore.group_counts groupings
+_COSMOS_GROUPINGS = {"assistant": "c.AssistantName", "day": "LEFT(c.TimeStamp, 10)"}
+
+
+def group_counts(container, start_ts, end_ts, by, fingerprint=None):
+    """
+    Document counts in a TimeStamp range grouped by "assistant" or "day",
+    computed by the local store or by a Cosmos GROUP BY query. Returns (key, count) pairs.
+    Cosmos results are cached per fingerprint of the range's data (see
+    analyses.period_fingerprint); ranges reaching today expire after CURRENT_QUARTER_TTL.
+    """
+    store = get_local_store()
+    if store is not None:
+        return store.group_counts(start_ts, end_ts, by)
+
+    cache_key = None
+    if fingerprint is not None:
+        cache_key = "|".join(
+            [by, start_ts, end_ts, str(fingerprint.get("count", 0)), str(fingerprint.get("max_ts"))]
+        )
+        cached = volume_cache.get(cache_key)
+        if cached is not None:
+            return [tuple(row) for row in cached]
+
+    expression = _COSMOS_GROUPINGS[by]
+    query = f"""
+        SELECT {expression} AS key, COUNT(1) AS count
+        FROM c
+        WHERE c.TimeStamp BETWEEN @start AND @end
+        GROUP BY {expression}
+    """
+    rows = container.query_items(
+        query=query,
+        parameters=[
+            {"name": "@start", "value": start_ts},
+            {"name": "@end", "value": end_ts},
+        ],
+        enable_cross_partition_query=True,
+        response_hook=record_request_charge,
+    )
+    rows = list(rows)
+    record_cosmos_page(len(rows))
+    counts = sorted(((row.get("key"), row["count"]) for row in rows), key=lambda row: str(row[0]))
+    if cache_key is not None:
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        ttl = None if end_ts[:10] < today else CURRENT_QUARTER_TTL
+        volume_cache.set(cache_key, counts, ttl=ttl)
+    return counts
+
+
+def volume_by_assistant(container, start_ts, end_ts, fingerprint=None):
+    """Chat counts per AssistantName as a DataFrame indexed by assistant."""
+    import pandas as pd
+
+    rows = group_counts(container, start_ts, end_ts, "assistant", fingerprint)
+    frame = pd.DataFrame(
+        [(key or "(Unknown)", count) for key, count in rows],
+        columns=["AssistantName", "Chats"],
+    )
+    return frame.groupby("AssistantName").sum().sort_values("Chats", ascending=False)
+
+
+def volume_by_day(container, start_ts, end_ts, fingerprint=None):
+    """Chat counts per day as a DataFrame indexed by date."""
+    import pandas as pd
+
+    rows = group_counts(container, start_ts, end_ts, "day", fingerprint)
+    frame = pd.DataFrame(rows, columns=["Day", "Chats"]).dropna()
+    frame["Day"] = pd.to_datetime(frame["Day"], errors="coerce")
+    return frame.dropna().set_index("Day").sort_index()
+
+
+def volume_by_week(daily):
+    """Roll per-day counts up to weeks starting on Monday."""
+    return daily.resample("W-MON", label="left", closed="left").sum()
+
+
+def volume_by_quarter(daily):
+    """Roll per-day counts up to calendar quarters."""
+    quarterly = daily.groupby(daily.index.quarter).sum()
+    quarterly.index = [f"Q{quarter}" for quarter in quarterly.index]
+    return quarterly
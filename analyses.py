@@ -0,0 +1,299 @@
+"""
+Expensive analyses run as background jobs (see jobs.py). Each job takes
+JSON-serializable parameters plus a progress callback and returns a
+JSON-serializable result. progress(message, partial) may also publish a
+partial result while the job runs.
+"""
+
+from datetime import datetime
+
+import tracing
+
+from cloud_config import (
+    get_container,
+    get_local_store,
+    local_store,
+    quarter_topics_cache,
+    COSMOS_PAGE_SIZE,
+    CURRENT_QUARTER_TTL,
+    MAX_TITLES_IN_MEMORY,
+    QUARTER_TIMEOUT,
+    TITLE_MAX_CHARS,
+)
+from dedup import compact_titles, format_counted
+from pipeline import iter_documents, iter_truncated, iter_preprocessed, reservoir_sample
+from prompts import compact_prompt
+from summarizer import map_reduce
+from topicmodelling_dev import extract_topics, interpret_topics_with_llm
+
+# Bump when the quarterly topics prompt changes to invalidate cached results
+TOPICS_PROMPT_VERSION = "4"
+
+
+def trend_analysis(titles, progress=None):
+    """Summary of key trends across titles (already formatted for the prompt)."""
+    return map_reduce(
+        titles,
+        map_messages=lambda titles_text: [
+            {
+                "role": "system",
+                "content": "You are an expert data analyst analyzing trends from user interaction data.",
+            },
+            {
+                "role": "user",
+                "content": compact_prompt(
+                    f"""
+                Analyze the following chat titles for trends, topics, and insights based on user interactions.
+                Provide a summary of key trends and observations.
+                A title ending in (xN) was asked N times.
+
+                Chat Titles:
+                {titles_text}
+            """
+                ),
+            },
+        ],
+        reduce_messages=lambda summaries_text: [
+            {
+                "role": "system",
+                "content": "You are an expert data analyst analyzing trends from user interaction data.",
+            },
+            {
+                "role": "user",
+                "content": compact_prompt(
+                    f"""
+                The following are trend summaries, each written for a different subset of the same chat titles.
+                Merge them into a single summary of key trends and observations across all chat titles.
+
+                Partial Summaries:
+                {summaries_text}
+            """
+                ),
+            },
+        ],
+        temperature=0.7,
+        progress=progress,
+    )
+
+
+def _publish_topics(progress):
+    """on_topic callback publishing the labels received so far as a partial result."""
+    if progress is None:
+        return None
+    labeled = []
+
+    def on_topic(topic):
+        labeled.append(topic)
+        progress(f"Labeled {len(labeled)} topics...", labeled)
+
+    return on_topic
+
+
+def nmf_topics(titles, counts=None, progress=None):
+    """NMF topics over preprocessed, compacted titles, labeled by the LLM."""
+    return extract_topics(
+        titles, preprocessed=True, counts=counts, on_topic=_publish_topics(progress)
+    )
+
+
+def label_topics(text, raw_topics, progress=None):
+    """LLM labels for precomputed raw topics (snapshots or semantic clusters)."""
+    return interpret_topics_with_llm(text, raw_topics, on_topic=_publish_topics(progress))
+
+
+def semantic_topics(titles, counts=None, progress=None):
+    """
+    Embed the unique titles (cached by hash), cluster them and label the
+    clusters with the LLM; counts weights the cluster sizes. Also saves the
+    titles' SemanticIndex for chat retrieval (see semantic.index_path).
+    """
+    from semantic import (
+        SemanticIndex,
+        cluster_titles,
+        format_clusters,
+        get_embedding_store,
+        index_path,
+    )
+
+    if progress:
+        progress("Embedding chat titles...")
+    with tracing.span("embed", titles=len(titles)):
+        embeddings = get_embedding_store().embed(titles)
+    if progress:
+        progress("Clustering chat titles...")
+    with tracing.span("cluster"):
+        raw_topics = format_clusters(cluster_titles(titles, embeddings, counts=counts))
+    # The chat retrieval index is built here too, off the app's request thread
+    with tracing.span("semantic_index"):
+        SemanticIndex.build(titles, embeddings).save(index_path(titles))
+    return interpret_topics_with_llm(
+        "\n".join(titles), raw_topics, on_topic=_publish_topics(progress)
+    )
+
+
+def period_bounds(start_date, end_date):
+    """TimeStamp bounds for a period given as "YYYY/MM/DD" dates."""
+    start_date_obj = datetime.strptime(start_date, "%Y/%m/%d")
+    end_date_obj = datetime.strptime(end_date, "%Y/%m/%d")
+    return (
+        start_date_obj.strftime("%Y-%m-%dT%H:%M:%S.000000Z"),
+        end_date_obj.strftime("%Y-%m-%dT%H:%M:%S.000000Z"),
+    )
+
+
+def period_fingerprint(start_date_str, end_date_str):
+    """Cheap fingerprint of a period's data: document count plus latest _ts."""
+    store = get_local_store()
+    if store is not None:
+        return store.fingerprint(start_date_str, end_date_str)
+    fingerprint_query = f"""
+        SELECT COUNT(1) AS count, MAX(c._ts) AS max_ts
+        FROM c
+        WHERE c.TimeStamp BETWEEN '{start_date_str}' AND '{end_date_str}'
+    """
+    fingerprint = list(
+        get_container().query_items(query=fingerprint_query, enable_cross_partition_query=True)
+    )
+    return fingerprint[0] if fingerprint else {}
+
+
+def period_titles(
+    start_date_str, end_date_str, max_chars=TITLE_MAX_CHARS, max_items=MAX_TITLES_IN_MEMORY
+):
+    """Truncated, preprocessed titles for a period as (bounded sample, total)."""
+    store = get_local_store()
+    if store is not None:
+        items = store.iter_range(start_date_str, end_date_str)
+    else:
+        query = f"""
+            SELECT c.ChatTitle
+            FROM c
+            WHERE c.TimeStamp BETWEEN '{start_date_str}' AND '{end_date_str}'
+            ORDER BY c.TimeStamp DESC
+        """
+        items = iter_documents(get_container(), query, page_size=COSMOS_PAGE_SIZE)
+
+    # Stream titles through truncation and cleaning into a bounded sample
+    chat_titles = (item["ChatTitle"] for item in iter_truncated(items, max_chars))
+    return reservoir_sample(iter_preprocessed(chat_titles), max_items)
+
+
+def quarter_topics(start_date, end_date, progress=None, processed_titles=None):
+    """
+    Top 10 topics for a quarter given as "YYYY/MM/DD" bounds. Pass
+    processed_titles when the quarter's titles are already loaded.
+    """
+    start_date_str, end_date_str = period_bounds(start_date, end_date)
+    end_date_obj = datetime.strptime(end_date, "%Y/%m/%d")
+    fingerprint = period_fingerprint(start_date_str, end_date_str)
+    cache_key = "|".join(
+        [
+            TOPICS_PROMPT_VERSION,
+            start_date,
+            end_date,
+            str(fingerprint.get("count", 0)),
+            str(fingerprint.get("max_ts")),
+        ]
+    )
+    cached = quarter_topics_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Closed quarters never change; the current one gets a short TTL
+    ttl = None if end_date_obj.date() < datetime.now().date() else CURRENT_QUARTER_TTL
+
+    if processed_titles is None:
+        if progress:
+            progress("Loading chat titles...")
+        processed_titles, _ = period_titles(start_date_str, end_date_str)
+
+    if not processed_titles:
+        quarter_topics_cache.set(cache_key, "No data available", ttl=ttl)
+        return "No data available"
+
+    # LLM call for top 10 topics over compacted titles, split into chunks
+    # for large quarters
+    top_topics = map_reduce(
+        format_counted(compact_titles(processed_titles)),
+        map_messages=lambda titles_text: [
+            {
+                "role": "system",
+                "content": "You're a very intelligent assistant.",
+            },
+            {
+                "role": "user",
+                "content": compact_prompt(
+                    f"""
+                You are a legal domain expert extracting top 10 unique topics from user chat titles. Respond with the list only, no explanation.
+                From the following user chat titles, identify and list the top 10 unique topics discussed. Do not add any explanation or extra words.
+                A title ending in (xN) was asked N times.
+
+                Chat Titles:
+                {titles_text}
+                """
+                ),
+            },
+        ],
+        reduce_messages=lambda lists_text: [
+            {
+                "role": "system",
+                "content": "You're a very intelligent assistant.",
+            },
+            {
+                "role": "user",
+                "content": compact_prompt(
+                    f"""
+                You are a legal domain expert. The following are top topic lists, each extracted from a different subset of the same user chat titles.
+                Merge them into one list of the top 10 unique topics overall. Respond with the list only, no explanation.
+
+                Topic Lists:
+                {lists_text}
+                """
+                ),
+            },
+        ],
+        temperature=0.5,
+        timeout=QUARTER_TIMEOUT,
+        progress=progress,
+    )
+    quarter_topics_cache.set(cache_key, top_topics, ttl=ttl)
+    return top_topics
+
+
+def compare_periods(periods, progress=None):
+    """
+    Topic shares, deltas and growth across periods given as
+    [name, start_date, end_date] triples, over one shared topic basis
+    labeled with a single LLM call.
+    """
+    from comparison import compare_titles
+
+    # Shares are proportions, so each period contributes an equal-sized sample
+    per_period = max(1, MAX_TITLES_IN_MEMORY // max(len(periods), 1))
+    titles, totals = {}, {}
+    for number, (name, start_date, end_date) in enumerate(periods, start=1):
+        if progress:
+            progress(f"Loading {name} ({number} of {len(periods)})...")
+        titles[name], totals[name] = period_titles(
+            *period_bounds(start_date, end_date), max_items=per_period
+        )
+    if progress:
+        progress("Fitting shared topics...")
+    return compare_titles(titles, totals)
+
+
+def sync_local_store(progress=None):
+    """Full sync of the local chat store, run out of band so the app never waits on it."""
+    return local_store.sync(get_container(), page_size=COSMOS_PAGE_SIZE, progress=progress)
+
+
+# Job kinds accepted by JobQueue.submit
+JOBS = {
+    "trend_analysis": trend_analysis,
+    "nmf_topics": nmf_topics,
+    "label_topics": label_topics,
+    "semantic_topics": semantic_topics,
+    "quarter_topics": quarter_topics,
+    "compare_periods": compare_periods,
+    "sync_local_store": sync_local_store,
+}
@@ -1,16 +1,47 @@
 import streamlit as st
+import json
+import logging
 from datetime import datetime
-from cloud_config import CONTAINER_NAME, ENDPOINT, DATABASE_NAME, llmclient, KEY
-from topicmodelling_dev import extract_topics_from_text
-from preprocessor import preprocess_text
-from azure.cosmos import CosmosClient
+from functools import partial
+from cloud_config import (
+    get_llm_client,
+    get_container,
+    get_job_queue,
+    check_health,
+    CURRENT_QUARTER_TTL,
+    QUARTER_TIMEOUT,
+    TRACE_LOG_PATH,
+    TRACE_HISTORY,
+    local_store,
+    LOCAL_SYNC_INTERVAL,
+    page_cursors,
+    COSMOS_PAGE_SIZE,
+    document_counts,
+    MAX_TITLES_IN_MEMORY,
+    TITLE_MAX_CHARS,
+)
+from topicmodelling_dev import format_topics
+from snapshots import range_topics
+from reports import current_report, quarter_periods, month_periods
+from analyses import period_fingerprint
+from comparison import comparison_frames
+from pagination import iter_pages
+from pipeline import iter_documents, iter_truncated, iter_preprocessed, reservoir_sample
+from dedup import compact_titles, format_counted
+from preprocessor import cache_stats as preprocess_cache_stats
+import tracing
+from tracing import start_trace, summarize, totals
+from context_builder import BM25Index, build_chat_messages, compute_stats
+from prompts import choose_model
+from aggregations import (
+    volume_by_assistant,
+    volume_by_day,
+    volume_by_week,
+    volume_by_quarter,
+)
 from dotenv import load_dotenv
 load_dotenv()
 
-client = CosmosClient(ENDPOINT, KEY)
-database = client.get_database_client(DATABASE_NAME)
-container = database.get_container_client(CONTAINER_NAME)
-
 # Initialize session state
 if "chats" not in st.session_state:
     st.session_state["chats"] = []
@@ -23,6 +54,87 @@ if "current_view" not in st.session_state:
 
 st.title("Chat DB Analytics")
 
+
+def record_trace(trace):
+    """Keep the session's most recent traces for the Diagnostics panel."""
+    traces = st.session_state.setdefault("traces", [])
+    traces.append(trace.to_dict())
+    del traces[:-TRACE_HISTORY]
+
+
+def local_store_ready():
+    """
+    Whether the local store can answer queries. Its first full sync runs as a
+    background job, retried at most every LOCAL_SYNC_INTERVAL seconds; until it
+    finishes, data is queried from Cosmos DB directly.
+    """
+    if local_store is None:
+        return False
+    if local_store.ready():
+        return True
+    job = get_job_queue().status(
+        get_job_queue().submit("sync_local_store", retry_after=LOCAL_SYNC_INTERVAL)
+    )
+    st.caption(
+        f"Building the local chat store in the background ({job['progress'] or job['status']}); "
+        "querying Cosmos DB directly until it is ready."
+    )
+    return False
+
+
+def semantic_index():
+    """
+    Retrieval index for the semantic engine, built once the semantic_topics job
+    has embedded the fetched titles; None (BM25 retrieval) until then.
+    """
+    if not st.session_state.get("semantic_pending"):
+        return st.session_state.get("semantic_index")
+    job = job_status("topics_job")
+    if job is None or job["status"] != "done":
+        return None
+    from semantic import SemanticIndex, index_path
+
+    titles = st.session_state["processed_titles"]
+    # The job saved the index; embeddings stay in the shared memory map
+    try:
+        st.session_state["semantic_index"] = SemanticIndex.load(index_path(titles), titles)
+    except OSError as e:
+        logging.warning(f"Semantic index unavailable, using BM25 retrieval: {e}")
+        st.session_state["semantic_index"] = None
+    st.session_state["semantic_pending"] = False
+    return st.session_state["semantic_index"]
+
+
+def show_job(job_id, render):
+    """
+    Show a background job with render(job) in a fragment that polls every 2
+    seconds while the job is queued or running. Once it is done, the page
+    reruns once so the fragment stops polling; a failed job is only rendered,
+    since a rerun could resubmit it.
+    """
+    if not job_id:
+        return
+    job = get_job_queue().status(job_id)
+    polling = job is not None and job["status"] in ("queued", "running")
+
+    @st.fragment(run_every=2 if polling else None)
+    def poll():
+        current = get_job_queue().status(job_id)
+        if current is None:
+            return
+        if polling and current["status"] == "done":
+            st.rerun()
+        render(current)
+
+    poll()
+
+
+def job_status(name):
+    """Status of the session's background job stored under name, if any."""
+    job_id = st.session_state.get(name)
+    return get_job_queue().status(job_id) if job_id else None
+
+
 # Navigation buttons
 col1, col2 = st.columns([1, 1])
 with col1:
@@ -133,12 +245,9 @@ with st.sidebar:
         start_offset = None  # Disable the offset for custom date range filtering
 
     elif filter_option == "Number of Entries":
-        # Slider to select the range of entries to fetch
-        query_len = """SELECT VALUE COUNT(c.id) FROM c """
-        res = list(
-            container.query_items(query=query_len, enable_cross_partition_query=True)
-        )
-        num_ent = res[0]
+        # Slider to select the range of entries to fetch; the count is cached
+        # and refreshed in the background so the slider renders immediately
+        num_ent = document_counts.get(get_container())
         limit = st.slider(
             "Select the number of entries to fetch",
             min_value=1000,
@@ -158,82 +267,137 @@ with st.sidebar:
         )
         end_date = None  # Disable the date range inputs for number of entries filtering
 
+    topic_engine = st.selectbox("Topic engine:", ("NMF", "Semantic clusters"))
+
     st.write("---")
     # Fetch button
     fetch_button = st.button("Fetch Data")
 
     if fetch_button:
-        try:
-            if filter_option == "Date Range":
-                # Handle both Monthly and Quarterly
-                start_date_obj = datetime.strptime(start_date, "%Y/%m/%d")
-                end_date_obj = datetime.strptime(end_date, "%Y/%m/%d")
-
-                start_date_str = start_date_obj.strftime("%Y-%m-%dT%H:%M:%S.000000Z")
-                end_date_str = end_date_obj.strftime("%Y-%m-%dT%H:%M:%S.000000Z")
-
-                query = f"SELECT c.id, c.TimeStamp, c.AssistantName, c.ChatTitle FROM c WHERE c.TimeStamp BETWEEN '{start_date_str}' AND '{end_date_str}' ORDER BY c.TimeStamp DESC"
-            elif filter_option == "Custom Date Range":
-                # Use the custom date range selected by the user
-                query = f"SELECT c.id, c.TimeStamp, c.AssistantName, c.ChatTitle FROM c WHERE c.TimeStamp BETWEEN '{start_date_str}T00:00:00.000000Z' AND '{end_date_str}T23:59:59.999999Z' ORDER BY c.TimeStamp DESC"
-            elif filter_option == "Number of Entries":
-                query = f"SELECT c.id, c.TimeStamp, c.AssistantName, c.ChatTitle FROM c ORDER BY c.TimeStamp DESC OFFSET {start_offset} LIMIT {limit}"
-
-            # Query Cosmos DB
-            items = list(
-                container.query_items(query=query, enable_cross_partition_query=True)
-            )
-
-            # Display results
-            if items:
-                st.write(f"Displaying {len(items)} chat entries:")
-                for i in range(len(items)):
-                    # Safely handle missing or empty ChatTitle
-                    chat_title = items[i].get("ChatTitle") or "(No Title)"
-                    items[i]["ChatTitle"] = chat_title[:50]
-                st.session_state["chats"] = list(items)
-
-                chat_titles = [
-                    (chat.get("ChatTitle") or "(No Title)")[:50] for chat in st.session_state["chats"]
-                ]
-                chat_titles_text = "\n".join(chat_titles)  # Join chat titles into a single text block
-                st.session_state["topics"] = extract_topics_from_text(chat_titles_text)
-                st.session_state["processed_chat_titles"] = preprocess_text(
-                    chat_titles_text
-                )
-
-                # Get trend analysis
-                if chat_titles:
-                    with st.spinner("Analyzing trends..."):
-                        trend_analysis_response = llmclient.chat.completions.create(
-                            model="model-router",
-                            messages=[
-                                {
-                                    "role": "system",
-                                    "content": "You are an expert data analyst analyzing trends from user interaction data.",
-                                },
-                                {
-                                    "role": "user",
-                                    "content": f"""
-                                    Analyze the following chat titles for trends, topics, and insights based on user interactions. 
-                                    Provide a summary of key trends and observations.
-                                    
-                                    Chat Titles:
-                                    {st.session_state["processed_chat_titles"]}
-                                """,
-                                },
-                            ],
-                            temperature=0.7,
-                            stream=False,  # We want a complete response, not a stream
+        with start_trace("fetch", log_path=TRACE_LOG_PATH, filter=filter_option) as fetch_trace:
+            try:
+                if filter_option == "Date Range":
+                    # Handle both Monthly and Quarterly
+                    start_date_obj = datetime.strptime(start_date, "%Y/%m/%d")
+                    end_date_obj = datetime.strptime(end_date, "%Y/%m/%d")
+
+                    start_date_str = start_date_obj.strftime("%Y-%m-%dT%H:%M:%S.000000Z")
+                    end_date_str = end_date_obj.strftime("%Y-%m-%dT%H:%M:%S.000000Z")
+
+                    range_start, range_end = start_date_str, end_date_str
+                elif filter_option == "Custom Date Range":
+                    # Use the custom date range selected by the user
+                    range_start = f"{start_date_str}T00:00:00.000000Z"
+                    range_end = f"{end_date_str}T23:59:59.999999Z"
+
+                # Documents are streamed, so this covers query, paging and sampling
+                with tracing.span("load_documents"):
+                    if local_store_ready():
+                        # Pull only documents changed since the last sync, then answer locally
+                        with tracing.span("local_sync"):
+                            local_store.sync_if_stale(get_container())
+                        if filter_option == "Number of Entries":
+                            items = local_store.query_latest(start_offset, limit)
+                        else:
+                            items = local_store.iter_range(range_start, range_end)
+                    elif filter_option == "Number of Entries":
+                        # Page with continuation tokens, resuming from the nearest cached
+                        # cursor, and stream pages into session state as they arrive
+                        # Paging reads a snapshot anchored on _ts so cached cursors stay valid
+                        query = "SELECT c.id, c.TimeStamp, c.AssistantName, c.ChatTitle FROM c WHERE c._ts <= @anchor ORDER BY c.TimeStamp DESC"
+                        items = []
+                        fetch_progress = st.empty()
+                        for page in iter_pages(
+                            get_container(),
+                            query,
+                            start_offset,
+                            limit,
+                            page_cursors,
+                            page_size=COSMOS_PAGE_SIZE,
+                        ):
+                            items.extend(page)
+                            st.session_state["chats"] = items
+                            fetch_progress.write(f"Fetched {len(items)} of {limit} entries...")
+                        fetch_progress.empty()
+                    else:
+                        query = f"SELECT c.id, c.TimeStamp, c.AssistantName, c.ChatTitle FROM c WHERE c.TimeStamp BETWEEN '{range_start}' AND '{range_end}' ORDER BY c.TimeStamp DESC"
+
+                        # Stream Cosmos DB results page by page
+                        items = iter_documents(get_container(), query, page_size=COSMOS_PAGE_SIZE)
+
+                    # Truncate titles as they stream in and keep a bounded sample in memory
+                    items, total_items = reservoir_sample(
+                        iter_truncated(items, TITLE_MAX_CHARS), MAX_TITLES_IN_MEMORY
+                    )
+
+                # Display results
+                if items:
+                    st.write(f"Displaying {total_items} chat entries:")
+                    if total_items > len(items):
+                        st.caption(
+                            f"Analyzing a random sample of {len(items)} entries to stay within memory limits."
                         )
-                        st.session_state["trend_analysis"] = (
-                            trend_analysis_response.choices[0].message.content
+                    st.session_state["chats"] = items
+
+                    chat_titles = [chat["ChatTitle"] for chat in items]
+                    # Preprocessed once and shared by topic modeling and the prompts
+                    with tracing.span("preprocess"):
+                        processed_titles = list(iter_preprocessed(chat_titles))
+                    # Repeated titles are analyzed once, weighted by their count
+                    with tracing.span("compact", titles=len(processed_titles)) as compact_span:
+                        title_counts = compact_titles(processed_titles)
+                        compact_span.set(unique_titles=len(title_counts))
+                    unique_titles = [title for title, _ in title_counts]
+                    st.session_state["title_counts"] = dict(title_counts)
+                    st.session_state["processed_titles"] = unique_titles
+                    with tracing.span("index"):
+                        st.session_state["title_index"] = BM25Index(unique_titles)
+                        st.session_state["chat_stats"] = compute_stats(items, total_items)
+
+                    # Topic labeling and trend analysis run as background jobs; the
+                    # Chat View polls for their results
+                    job_queue = get_job_queue()
+                    st.session_state["semantic_index"] = None
+                    st.session_state["semantic_pending"] = topic_engine == "Semantic clusters"
+                    if topic_engine == "Semantic clusters":
+                        # Embedding, clustering and labeling run in the job; chat
+                        # retrieval switches to the semantic index once it is done
+                        st.session_state["topics_job"] = job_queue.submit(
+                            "semantic_topics",
+                            titles=unique_titles,
+                            counts=[count for _, count in title_counts],
                         )
-            else:
-                st.write("No data found for the selected range.")
-
-        except Exception as e:
-            st.write(f"An error occurred: {str(e)}")
+                    else:
+                        # Merge precomputed daily topic snapshots when they cover the range
+                        snapshot_topics = None
+                        if filter_option != "Number of Entries":
+                            with tracing.span("snapshot_topics"):
+                                snapshot_topics = range_topics(
+                                    datetime.strptime(range_start[:10], "%Y-%m-%d").date(),
+                                    datetime.strptime(range_end[:10], "%Y-%m-%d").date(),
+                                )
+                        if snapshot_topics:
+                            st.session_state["topics_job"] = job_queue.submit(
+                                "label_topics",
+                                text="\n".join(chat_titles)[:1000],
+                                raw_topics=format_topics(snapshot_topics),
+                            )
+                        else:
+                            st.session_state["topics_job"] = job_queue.submit(
+                                "nmf_topics",
+                                titles=unique_titles,
+                                counts=[count for _, count in title_counts],
+                            )
+
+                    st.session_state["trend_job"] = job_queue.submit(
+                        "trend_analysis", titles=format_counted(title_counts)
+                    )
+                else:
+                    st.write("No data found for the selected range.")
+
+            except Exception as e:
+                st.write(f"An error occurred: {str(e)}")
+        record_trace(fetch_trace)
 
     # Display filter information
     if "chats" in st.session_state and st.session_state["chats"]:
@@ -250,6 +414,53 @@ with st.sidebar:
             st.write(f"Limit: {limit}")
             st.write(f"Start Offset: {start_offset}")
 
+    with st.expander("Service Health"):
+        if st.button("Check Connections"):
+            for service, status in check_health().items():
+                if status["ok"]:
+                    st.success(f"{service}: OK ({status['latency_ms']:.0f} ms)")
+                else:
+                    st.error(f"{service}: {status['error']}")
+
+    with st.expander("Diagnostics"):
+        # This session's fetch and chat traces, plus the traces of its background jobs
+        traces = list(st.session_state.get("traces", []))
+        job_ids = [
+            st.session_state.get(name) for name in ("topics_job", "trend_job", "compare_job")
+        ]
+        job_ids += list(st.session_state.get("quarter_jobs", {}).values())
+        for job_id in job_ids:
+            job = get_job_queue().status(job_id) if job_id else None
+            if job and job["trace"]:
+                traces.append(job["trace"])
+
+        # LLM calls run in the job workers too, so hits and misses come from the traces
+        llm = totals(traces, "llm_cache_hits", "llm_cache_misses")
+        llm_calls = llm["llm_cache_hits"] + llm["llm_cache_misses"]
+        st.markdown("**Cache hit rates**")
+        st.dataframe(
+            [
+                {
+                    "cache": "LLM responses",
+                    "hits": llm["llm_cache_hits"],
+                    "misses": llm["llm_cache_misses"],
+                    "hit_rate": llm["llm_cache_hits"] / llm_calls if llm_calls else 0.0,
+                },
+                {"cache": "Preprocessed titles", **preprocess_cache_stats()},
+            ],
+            hide_index=True,
+        )
+        for trace in reversed(traces):
+            st.markdown(f"**{trace['trace']}**")
+            st.dataframe(summarize(trace), hide_index=True)
+        if traces:
+            st.download_button(
+                "Export traces (JSON)",
+                json.dumps(traces, indent=2),
+                file_name="promptquest_traces.json",
+                mime="application/json",
+            )
+
 # Display Chat View
 if st.session_state["current_view"] == "Chat":
     st.markdown(
@@ -257,11 +468,33 @@ if st.session_state["current_view"] == "Chat":
         unsafe_allow_html=True,
     )
 
-    # Display trend analysis if available
-    if "trend_analysis" in st.session_state and st.session_state["trend_analysis"]:
-        st.write("### Trend Analysis")
-        st.markdown(st.session_state["trend_analysis"])
-        st.write("---")
+    # Display trend analysis, polling until the background job finishes
+    def show_trend_analysis(job):
+        if job["status"] == "done":
+            st.write("### Trend Analysis")
+            st.markdown(job["result"])
+            st.write("---")
+        elif job["status"] == "failed":
+            st.error(f"Trend analysis failed: {job['error']}")
+        else:
+            st.info(f"Analyzing trends... {job['progress'] or ''}")
+
+    show_job(st.session_state.get("trend_job"), show_trend_analysis)
+
+    # Topic labels appear one by one as the labeling job streams them in
+    def show_topics(job):
+        if job["status"] == "failed":
+            return
+        if job["result"]:
+            st.write("### Highlighted Topics")
+            for topic in job["result"]:
+                st.markdown(f"**{topic['label']}**: {topic['description']}")
+        if job["status"] != "done":
+            st.info(job["progress"] or "Labeling topics...")
+        else:
+            st.write("---")
+
+    show_job(st.session_state.get("topics_job"), show_topics)
 
     # Display previous messages (for chat history)
     for message in st.session_state["messages"]:
@@ -276,44 +509,42 @@ if st.session_state["current_view"] == "Chat":
             with st.chat_message("user"):
                 st.markdown(prompt)
 
-            with st.spinner("Thinking..."):
-                response_stream = llmclient.chat.completions.create(
-                    model="model-router",
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "You are an expert product analyst who analyses software products based on the user statistics from user database.",
-                        },
-                        {
-                            "role": "user",
-                            "content": f"""
-                            Answer the user's prompt based on the following data from the database. 
-                            The database contains usage history of user questions and AI responses from an AI-assisted chatbot interface, specifically used for legal advice.
-
-                            User Chat Titles: 
-                            {st.session_state["processed_chat_titles"]}
-                            Highlighted topics:
-                            {st.session_state["topics"]}
-
-                            ---
-                            Prompt: {prompt}
-
-                            ---
-                            Intelligently analyze the user's intent in the prompt and provide an insightful answer, utilizing relevant data and context from the chat titles.
-                            """,
-                        },
-                    ],
-                    temperature=0.7,
-                    stream=True,
-                )
+            # Topic labels are left out until their job has finished
+            topics_job = job_status("topics_job")
+            topics = topics_job["result"] if topics_job and topics_job["status"] == "done" else ""
+
+            with start_trace("chat", log_path=TRACE_LOG_PATH) as chat_trace:
+                # Only titles relevant to this prompt, compact stats/topics and a
+                # trimmed history, so the prompt size stays flat as ranges grow
+                with tracing.span("build_prompt"):
+                    messages = build_chat_messages(
+                        prompt,
+                        st.session_state["processed_titles"],
+                        st.session_state["title_index"],
+                        topics,
+                        st.session_state["chat_stats"],
+                        st.session_state["messages"][:-1],
+                        semantic_index=semantic_index(),
+                        counts=st.session_state["title_counts"],
+                    )
+
+                with tracing.span("llm_stream"):
+                    with st.spinner("Thinking..."):
+                        response_stream = get_llm_client().chat.completions.create(
+                            model=choose_model(messages),
+                            messages=messages,
+                            temperature=0.7,
+                            stream=True,
+                        )
 
-            with st.chat_message("assistant"):
-                message_placeholder = st.empty()
-                bot_response = ""
-                for chunk in response_stream:
-                    if chunk.choices:
-                        bot_response += chunk.choices[0].delta.content or ""
-                        message_placeholder.markdown(bot_response)
+                    with st.chat_message("assistant"):
+                        message_placeholder = st.empty()
+                        bot_response = ""
+                        for chunk in response_stream:
+                            if chunk.choices:
+                                bot_response += chunk.choices[0].delta.content or ""
+                                message_placeholder.markdown(bot_response)
+            record_trace(chat_trace)
             st.session_state["messages"].append(
                 {"role": "assistant", "content": bot_response}
             )
@@ -340,72 +571,128 @@ elif st.session_state["current_view"] == "Analytics":
         "Q4": (f"{selected_year}/10/01", f"{selected_year}/12/31"),
     }
 
-    def get_top_topics(start_date, end_date):
-        start_date_obj = datetime.strptime(start_date, "%Y/%m/%d")
-        end_date_obj = datetime.strptime(end_date, "%Y/%m/%d")
-        start_date_str = start_date_obj.strftime("%Y-%m-%dT%H:%M:%S.000000Z")
-        end_date_str = end_date_obj.strftime("%Y-%m-%dT%H:%M:%S.000000Z")
-
-        query = f"""
-            SELECT c.ChatTitle 
-            FROM c 
-            WHERE c.TimeStamp BETWEEN '{start_date_str}' AND '{end_date_str}'
-            ORDER BY c.TimeStamp DESC
-        """
-        items = list(
-            container.query_items(query=query, enable_cross_partition_query=True)
-        )
-        chat_titles = "\n".join([(item.get("ChatTitle") or "(No Title)")[:100] for item in items])
+    with start_trace("analytics", log_path=TRACE_LOG_PATH, year=selected_year) as analytics_trace:
+        if local_store_ready():
+            with tracing.span("local_sync"):
+                local_store.sync_if_stale(get_container())
 
-        if not chat_titles.strip():
-            return "No data available"
+        # Chat volume from grouped counts, not raw documents
+        try:
+            with tracing.span("volume"):
+                year_start = f"{selected_year}-01-01T00:00:00.000000Z"
+                year_end = f"{selected_year}-12-31T23:59:59.999999Z"
+                # One cheap count/max query keys both cached GROUP BY results
+                fingerprint = period_fingerprint(year_start, year_end)
+                daily_volume = volume_by_day(get_container(), year_start, year_end, fingerprint)
+                if not daily_volume.empty:
+                    v1, v2 = st.columns(2)
+                    with v1:
+                        st.markdown("**Chats per Quarter**")
+                        st.bar_chart(volume_by_quarter(daily_volume))
+                    with v2:
+                        st.markdown("**Chats per Assistant**")
+                        st.bar_chart(
+                            volume_by_assistant(get_container(), year_start, year_end, fingerprint)
+                        )
+                    st.markdown("**Chats per Week**")
+                    st.line_chart(volume_by_week(daily_volume))
+        except Exception as e:
+            st.write(f"An error occurred: {str(e)}")
+    record_trace(analytics_trace)
+
+    # Quarterly topics are analyzed by background jobs shared across sessions;
+    # each quarter polls for its own result
+    def show_quarter(quarter_name, submit, job):
+        if job["status"] == "done":
+            st.write(job["result"])
+        elif job["status"] == "failed":
+            st.error(f"An error occurred: {job['error']}")
+            # Failed quarters stay failed until retried here
+            if st.button("Retry", key=f"retry_{quarter_name}"):
+                submit(retry_after=0)
+                st.rerun()
+        else:
+            st.info(job["progress"] or f"Loading {quarter_name} data...")
 
-        processed_titles = preprocess_text(chat_titles)
+    # Display topics in 4 containers for each quarter
+    q1, q2 = st.columns(2)
+    q3, q4 = st.columns(2)
 
-        # LLM call for top 10 topics
-        response = llmclient.chat.completions.create(
-            model="model-router",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You're a very intelligent assistant.",
-                },
-                {
-                    "role": "user",
-                    "content": f"""
-                    You are a legal domain expert extracting top 10 unique topics from user chat titles. Respond with the list only, no explanation.
-                    From the following user chat titles, identify and list the top 10 unique topics discussed. Do not add any explanation or extra words.
-
-                    Chat Titles:
-                    {processed_titles}
-                    """,
-                },
+    job_queue = get_job_queue()
+    today = datetime.now().date()
+    for quarter_name, column in zip(quarters, (q1, q2, q3, q4)):
+        quarter_start, quarter_end = quarters[quarter_name]
+
+        # Reports precomputed by reports.py are shown as is
+        report = current_report(f"{selected_year}-{quarter_name}", quarter_end)
+        if report is not None:
+            with column.container(height=500, border=True):
+                st.markdown(f"**{quarter_name} Topics**")
+                st.write(report["top_topics"])
+                if report["trend_analysis"]:
+                    with st.expander("Trend Analysis"):
+                        st.markdown(report["trend_analysis"])
+                st.caption(f"Precomputed report from {report['generated_at'][:16]} UTC")
+            continue
+
+        # The current quarter's result goes stale as new chats arrive
+        ttl = (
+            CURRENT_QUARTER_TTL
+            if datetime.strptime(quarter_end, "%Y/%m/%d").date() >= today
+            else None
+        )
+        submit = partial(
+            job_queue.submit,
+            "quarter_topics",
+            ttl=ttl,
+            timeout=QUARTER_TIMEOUT,
+            start_date=quarter_start,
+            end_date=quarter_end,
+        )
+        job_id = submit(retry_after=float("inf"))
+        st.session_state.setdefault("quarter_jobs", {})[quarter_name] = job_id
+        with column.container(height=500, border=True):
+            st.markdown(f"**{quarter_name} Topics**")
+            show_job(job_id, partial(show_quarter, quarter_name, submit))
+
+    st.subheader("Period Comparison")
+
+    # All periods share one topic basis, so shares are comparable across them
+    c1, c2 = st.columns(2)
+    with c1:
+        year_options = list(range(current_year - 3, current_year + 1))
+        compare_years = st.multiselect(
+            "Years",
+            options=year_options,
+            default=[
+                year
+                for year in (int(selected_year) - 1, int(selected_year))
+                if year in year_options
             ],
-            temperature=0.5,
-            stream=False,
         )
-        return response.choices[0].message.content.strip()
+    with c2:
+        granularity = st.radio("Compare by", ["Quarter", "Month"], horizontal=True)
 
-    # Display topics in 4 containers for each quarter
-    q1, q2 = st.columns(2)
-    q3, q4 = st.columns(2)
+    if st.button("Compare Periods") and compare_years:
+        periods = (quarter_periods if granularity == "Quarter" else month_periods)(
+            sorted(compare_years)
+        )
+        st.session_state["compare_job"] = get_job_queue().submit(
+            "compare_periods", periods=[list(period) for period in periods]
+        )
+
+    def show_comparison(job):
+        if job["status"] == "failed":
+            st.error(f"An error occurred: {job['error']}")
+        elif job["status"] != "done":
+            st.info(job["progress"] or "Comparing periods...")
+        elif not job["result"]["labels"]:
+            st.write("No data available")
+        else:
+            shares, changes = comparison_frames(job["result"])
+            st.markdown("**Topic Share per Period (%)**")
+            st.line_chart(shares)
+            st.markdown(f"**Latest Period ({shares.index[-1]}) vs Previous**")
+            st.dataframe(changes)
 
-    with q1.container(height=500, border=True):
-        st.markdown("**Q1 Topics**")
-        with st.spinner("Loading Q1 data..."):
-            st.write(get_top_topics(*quarters["Q1"]))
-
-    with q2.container(height=500, border=True):
-        st.markdown("**Q2 Topics**")
-        with st.spinner("Loading Q2 data..."):
-            st.write(get_top_topics(*quarters["Q2"]))
-
-    with q3.container(height=500, border=True):
-        st.markdown("**Q3 Topics**")
-        with st.spinner("Loading Q3 data..."):
-            st.write(get_top_topics(*quarters["Q3"]))
-
-    with q4.container(height=500, border=True):
-        st.markdown("**Q4 Topics**")
-        with st.spinner("Loading Q4 data..."):
-            st.write(get_top_topics(*quarters["Q4"]))
+    show_job(st.session_state.get("compare_job"), show_comparison)
@@ -0,0 +1,383 @@
+"""
+Offline benchmark of the analysis pipeline against local stand-ins for
+Cosmos DB and Azure OpenAI, so runs need no network access or credentials.
+
+Usage:
+    python bench.py [--titles 100000] [--llm-latency 0.05] [--output bench.json]
+    python bench.py --baseline bench.json   # compare against an earlier run
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+# Synthetic corpus: titles are drawn from a Zipf-weighted pool of distinct titles,
+# so frequent placeholders and repeats appear as they do in real chat logs
+SUBJECTS = [
+    "contract", "lease", "employment", "divorce", "custody", "tenancy", "probate",
+    "copyright", "trademark", "tax", "insurance", "mortgage", "negligence", "visa",
+    "dismissal", "inheritance", "licence", "partnership", "debt", "privacy",
+]
+ACTIONS = [
+    "breach of", "drafting a", "termination of", "dispute over", "review of",
+    "notice for", "appeal against", "claim under", "renewal of", "questions about",
+]
+QUALIFIERS = [
+    "", "in England", "for a small business", "after 5 years", "with no written terms",
+    "urgent", "template", "deadline", "costs", "next steps",
+]
+PLACEHOLDERS = ["(No Title)", "New chat", "Untitled"]
+ASSISTANTS = ["LegalAssist", "ContractBot", "Research", None]
+
+BENCH_START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+BENCH_DAYS = 365
+
+CHAT_QUESTIONS = [
+    "What are the most common contract questions?",
+    "How did employment dismissal questions change?",
+    "Summarize tenancy and lease topics",
+]
+
+
+def _title_pool(size, seed):
+    rng = random.Random(seed)
+    distinct = PLACEHOLDERS + [
+        f"{action} {subject} {qualifier}".strip()
+        for subject in SUBJECTS
+        for action in ACTIONS
+        for qualifier in QUALIFIERS
+    ]
+    weights = [1 / (rank + 1) for rank in range(len(distinct))]
+    return rng.choices(distinct, weights=weights, k=size)
+
+
+class FakeItems:
+    """Query result with the by_page() paging used by pipeline.iter_documents."""
+
+    def __init__(self, rows, page_size):
+        self._rows = rows
+        self._page_size = page_size or 1000
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def by_page(self):
+        page = []
+        for row in self._rows:
+            page.append(row)
+            if len(page) == self._page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+
+class FakeContainer:
+    """
+    Stand-in for a Cosmos DB container over n synthetic chat documents spread
+    evenly across BENCH_DAYS. Supports TimeStamp BETWEEN filters (inline or
+    @start/@end parameters) and COUNT/MAX fingerprint queries.
+    """
+
+    def __init__(self, n_documents, seed=42):
+        self.n_documents = n_documents
+        self._pool = _title_pool(min(n_documents, 100000), seed)
+        self._step = BENCH_DAYS * 86400 / n_documents
+
+    def _document(self, i):
+        ts = BENCH_START + timedelta(seconds=i * self._step)
+        return {
+            "id": str(i),
+            "TimeStamp": ts.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "AssistantName": ASSISTANTS[i % len(ASSISTANTS)],
+            "ChatTitle": self._pool[i % len(self._pool)],
+            "_ts": int(ts.timestamp()),
+        }
+
+    def _index_range(self, query, parameters):
+        bounds = re.search(r"BETWEEN '([^']+)' AND '([^']+)'", query)
+        if bounds:
+            start, end = bounds.groups()
+        else:
+            values = {p["name"]: p["value"] for p in parameters or []}
+            start, end = values.get("@start"), values.get("@end")
+        if start is None:
+            return 0, self.n_documents
+
+        def index_at(value):
+            ts = datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+            return int((ts - BENCH_START).total_seconds() / self._step)
+
+        first = max(0, index_at(start))
+        last = min(self.n_documents, index_at(end) + 1)
+        return first, max(first, last)
+
+    def query_items(self, query, parameters=None, max_item_count=None, **kwargs):
+        first, last = self._index_range(query, parameters)
+        if "COUNT(1)" in query:
+            max_ts = self._document(last - 1)["_ts"] if last > first else None
+            return FakeItems([{"count": last - first, "max_ts": max_ts}], max_item_count)
+        rows = (self._document(i) for i in range(first, last))
+        if "DESC" in query:
+            rows = (self._document(i) for i in range(last - 1, first - 1, -1))
+        return FakeItems(rows, max_item_count)
+
+    def read(self):
+        return {"id": "bench"}
+
+
+class FakeLLMClient:
+    """
+    Stand-in for the Azure OpenAI client: waits latency seconds, then answers
+    (streamed in chunks chunk_delay apart when stream=True). Requests with a
+    response_format get schema-valid topic labels so the labeling path is
+    exercised end to end.
+    """
+
+    def __init__(self, latency=0.05, chunk_delay=0.005, chunks=20):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _answer(self, messages, response_format=None):
+        if response_format is not None:
+            # One label per numbered raw topic in the prompt
+            numbers = re.findall(r"^\[(\d+)\]", messages[-1]["content"], re.MULTILINE)
+            return json.dumps(
+                {
+                    "topics": [
+                        {"topic": int(n), "label": f"Topic {n}", "description": "Synthetic topic."}
+                        for n in numbers
+                    ]
+                }
+            )
+        return "\n".join(f"{i + 1}. Synthetic finding" for i in range(10))
+
+    def create(self, model, messages, stream=False, response_format=None, **kwargs):
+        self.calls += 1
+        self.prompt_tokens += sum(len(m["content"]) // 4 + 1 for m in messages)
+        time.sleep(self.latency)
+        answer = self._answer(messages, response_format)
+        if not stream:
+            message = SimpleNamespace(role="assistant", content=answer)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+        return self._stream(answer)
+
+    def _stream(self, answer):
+        size = max(1, len(answer) // self.chunks)
+        for start in range(0, len(answer), size):
+            time.sleep(self.chunk_delay)
+            delta = SimpleNamespace(role="assistant", content=answer[start : start + size])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+
+    def stats(self):
+        return {"calls": self.calls, "prompt_tokens": self.prompt_tokens}
+
+
+def measure(results, name, fn, items=None):
+    """Run fn once, recording wall time, peak traced memory and throughput."""
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    value = fn()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    count = items(value) if callable(items) else items
+    results[name] = {
+        "wall_s": round(seconds, 4),
+        "peak_mb": round(peak / 2**20, 2),
+        "items": count,
+        "items_per_s": round(count / seconds, 1) if count and seconds else None,
+    }
+    return value
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(n_titles, llm_latency, chunk_delay):
+    """Run every stage once and return {stage: metrics}."""
+    # Imported here so the environment overrides in main() apply to cloud_config
+    import cloud_config
+    from analyses import quarter_topics, trend_analysis
+    from context_builder import BM25Index, build_chat_messages, compute_stats
+    from dedup import compact_titles, format_counted
+    from pipeline import iter_documents, iter_truncated, iter_preprocessed, reservoir_sample
+    from preprocessor import _preprocess_cached
+    from topicmodelling_dev import extract_topics, fit_topics
+
+    container = FakeContainer(n_titles)
+    llm = FakeLLMClient(latency=llm_latency, chunk_delay=chunk_delay)
+    cloud_config._clients["container"] = container
+    cloud_config._clients["llm"] = llm
+
+    # Import cost is tracked by startup_budget.py, not by the stage timings
+    import sklearn.decomposition  # noqa: F401
+    import sklearn.feature_extraction.text  # noqa: F401
+
+    stages = {}
+    tracemalloc.start()
+    try:
+        query = "SELECT c.id, c.TimeStamp, c.AssistantName, c.ChatTitle FROM c ORDER BY c.TimeStamp DESC"
+        items, total = measure(
+            stages,
+            "fetch",
+            lambda: reservoir_sample(
+                iter_truncated(
+                    iter_documents(container, query, page_size=cloud_config.COSMOS_PAGE_SIZE),
+                    cloud_config.TITLE_MAX_CHARS,
+                ),
+                cloud_config.MAX_TITLES_IN_MEMORY,
+            ),
+            items=n_titles,
+        )
+        chat_titles = [chat["ChatTitle"] for chat in items]
+
+        _preprocess_cached.cache_clear()
+        processed = measure(
+            stages,
+            "preprocess",
+            lambda: list(iter_preprocessed(chat_titles)),
+            items=len(chat_titles),
+        )
+        title_counts = measure(
+            stages, "compact", lambda: compact_titles(processed), items=len(processed)
+        )
+        unique_titles = [title for title, _ in title_counts]
+        counts = [count for _, count in title_counts]
+
+        measure(
+            stages,
+            "topic_model",
+            lambda: fit_topics(unique_titles, preprocessed=True, refit=True, counts=counts),
+            items=len(unique_titles),
+        )
+        measure(
+            stages,
+            "topics_labeled",
+            lambda: extract_topics(unique_titles, preprocessed=True, counts=counts),
+            items=len(unique_titles),
+        )
+        measure(
+            stages,
+            "trend_analysis",
+            lambda: trend_analysis(format_counted(title_counts)),
+            items=len(unique_titles),
+        )
+        measure(
+            stages,
+            "quarterly_analysis",
+            lambda: [
+                quarter_topics(start, end)
+                for start, end in (
+                    ("2024/01/01", "2024/03/31"),
+                    ("2024/04/01", "2024/06/30"),
+                    ("2024/07/01", "2024/09/30"),
+                    ("2024/10/01", "2024/12/31"),
+                )
+            ],
+            items=n_titles,
+        )
+
+        def build_prompts():
+            index = BM25Index(unique_titles)
+            stats = compute_stats(items, total)
+            return [
+                build_chat_messages(
+                    question, unique_titles, index, [], stats, [], counts=dict(title_counts)
+                )
+                for question in CHAT_QUESTIONS
+            ]
+
+        measure(stages, "chat_prompt", build_prompts, items=len(CHAT_QUESTIONS))
+
+        def first_token():
+            start = time.perf_counter()
+            stream = llm.create(model="bench", messages=[{"role": "user", "content": "hi"}], stream=True)
+            next(stream)
+            ttft = time.perf_counter() - start
+            for _ in stream:
+                pass
+            return ttft
+
+        ttft = measure(stages, "chat_stream", first_token, items=1)
+        stages["chat_stream"]["ttft_s"] = round(ttft, 4)
+    finally:
+        tracemalloc.stop()
+
+    stages["llm"] = llm.stats()
+    return stages
+
+
+def print_results(stages, baseline=None):
+    print(f"{'stage':>20} {'wall s':>9} {'peak MB':>9} {'items/s':>12}  vs baseline")
+    for name, metrics in stages.items():
+        if "wall_s" not in metrics:
+            continue
+        change = ""
+        if baseline and name in baseline and baseline[name].get("wall_s"):
+            change = f"{metrics['wall_s'] / baseline[name]['wall_s']:.2f}x"
+        rate = f"{metrics['items_per_s']:,.0f}" if metrics["items_per_s"] else "-"
+        print(
+            f"{name:>20} {metrics['wall_s']:>9.3f} {metrics['peak_mb']:>9.1f} {rate:>12}  {change}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline offline.")
+    parser.add_argument("--titles", type=int, default=100000, help="Synthetic documents in the container")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake LLM latency per call (s)")
+    parser.add_argument("--chunk-delay", type=float, default=0.005, help="Fake LLM delay per streamed chunk (s)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier JSON results to compare wall times against")
+    args = parser.parse_args()
+
+    # Keep runs isolated from the app's local store, caches and .env endpoints
+    workdir = tempfile.mkdtemp(prefix="promptquest-bench-")
+    os.environ["LOCAL_STORE_ENABLED"] = "0"
+    os.environ["LLM_CACHE_DISK"] = "0"
+    os.environ["CACHE_PATH"] = os.path.join(workdir, "cache.db")
+
+    stages = run(args.titles, args.llm_latency, args.chunk_delay)
+    report = {
+        "commit": _git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "stages": stages,
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["stages"]
+    print_results(stages, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
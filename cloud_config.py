@@ -1,6 +1,13 @@
 import os
-from openai import AzureOpenAI
+import threading
+import time
 from dotenv import load_dotenv
+from cache import TieredCache
+from llm_cache import CachedLLMClient
+from local_store import LocalChatStore
+from pagination import PageCursorCache
+from counts import DocumentCountProvider
+from jobs import JobQueue
 load_dotenv()
 
 ENDPOINT = os.getenv("DB_ENDPOINT")
@@ -8,9 +15,223 @@ KEY = os.getenv("DB_KEY")
 DATABASE_NAME = os.getenv("DB_NAME")
 CONTAINER_NAME = os.getenv("DB_CONTAINER_NAME")
 
-# LLM setup
-llmclient = AzureOpenAI(
-    azure_endpoint=os.getenv("LLM_ENDPOINT"),
-    api_key=os.getenv("LLM_KEY"),
-    api_version="2024-10-01-preview",
+# Background analysis jobs (see jobs.py)
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "promptquest_jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "900"))
+# Time limit of a whole quarterly analysis job, and of each of its LLM requests
+QUARTER_TIMEOUT = float(os.getenv("QUARTER_TIMEOUT", "120"))
+
+# Result caching
+CACHE_PATH = os.getenv("CACHE_PATH", "promptquest_cache.db")
+CURRENT_QUARTER_TTL = float(os.getenv("CURRENT_QUARTER_TTL", "900"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "256"))
+LLM_CACHE_DISK = os.getenv("LLM_CACHE_DISK", "1") == "1"
+
+# Map-reduce summarization of ranges larger than one prompt
+LLM_CHUNK_TOKENS = int(os.getenv("LLM_CHUNK_TOKENS", "60000"))
+LLM_MAP_CONCURRENCY = int(os.getenv("LLM_MAP_CONCURRENCY", "4"))
+
+# Cosmos query page size and cached continuation tokens for entry paging
+COSMOS_PAGE_SIZE = int(os.getenv("COSMOS_PAGE_SIZE", "1000"))
+PAGE_CURSOR_TTL = float(os.getenv("PAGE_CURSOR_TTL", "600"))
+page_cursors = PageCursorCache(ttl=PAGE_CURSOR_TTL)
+
+# Upper bound on chat titles held in memory for analysis; larger ranges are sampled
+MAX_TITLES_IN_MEMORY = int(os.getenv("MAX_TITLES_IN_MEMORY", "50000"))
+
+# Chat titles are truncated to this many characters everywhere they are loaded
+TITLE_MAX_CHARS = int(os.getenv("TITLE_MAX_CHARS", "100"))
+
+# Prompt token counting (tiktoken encoding) and model tiers by prompt size (see prompts.py)
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "o200k_base")
+# tiktoken reads its encoding files from here; the app never downloads them
+# (run `python prompts.py` once to fetch them)
+TIKTOKEN_CACHE_DIR = os.environ.setdefault("TIKTOKEN_CACHE_DIR", "tiktoken_cache")
+LLM_SMALL_MODEL = os.getenv("LLM_SMALL_MODEL", "model-router")
+LLM_LARGE_MODEL = os.getenv("LLM_LARGE_MODEL", "gpt-4.1")
+LLM_SMALL_MODEL_MAX_TOKENS = int(os.getenv("LLM_SMALL_MODEL_MAX_TOKENS", "16000"))
+TOPIC_SAMPLE_TOKENS = int(os.getenv("TOPIC_SAMPLE_TOKENS", "300"))
+
+# Re-requests of topic labels missing or malformed in a structured LLM response
+LLM_JSON_RETRIES = int(os.getenv("LLM_JSON_RETRIES", "2"))
+
+# Local chat-title store, synced incrementally from Cosmos DB
+LOCAL_STORE_ENABLED = os.getenv("LOCAL_STORE_ENABLED", "1") == "1"
+LOCAL_STORE_PATH = os.getenv("LOCAL_STORE_PATH", "chat_titles.db")
+LOCAL_SYNC_INTERVAL = float(os.getenv("LOCAL_SYNC_INTERVAL", "300"))
+
+local_store = (
+    LocalChatStore(LOCAL_STORE_PATH, sync_interval=LOCAL_SYNC_INTERVAL)
+    if LOCAL_STORE_ENABLED
+    else None
 )
+
+def get_local_store():
+    """The local chat store once its first full sync has completed, else None."""
+    return local_store if local_store is not None and local_store.ready() else None
+
+
+# Per-day topic model snapshots (see snapshots.py)
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+
+# Precomputed quarterly reports (see reports.py)
+REPORT_DIR = os.getenv("REPORT_DIR", "reports")
+
+# Per-stage tracing: finished traces are appended as JSON lines when set
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH")
+TRACE_HISTORY = int(os.getenv("TRACE_HISTORY", "20"))
+
+# Title compaction: exact duplicates are always collapsed; near duplicates
+# (MinHash estimated Jaccard similarity) only when enabled
+DEDUP_NEAR_DUPLICATES = os.getenv("DEDUP_NEAR_DUPLICATES", "0") == "1"
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", "0.8"))
+
+# Chat View prompt budgets (tokens)
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "8000"))
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "2000"))
+
+# Semantic topic engine: local embedding model and cached title embeddings
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_DIR = os.getenv("EMBEDDING_DIR", "embeddings")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+SEMANTIC_TOP_K = int(os.getenv("SEMANTIC_TOP_K", "200"))
+
+# Document count for the entries slider
+DOCUMENT_COUNT_TTL = float(os.getenv("DOCUMENT_COUNT_TTL", "300"))
+document_counts = DocumentCountProvider(ttl=DOCUMENT_COUNT_TTL, local_store=local_store)
+
+# Quarterly topic lists from the Analytics View
+quarter_topics_cache = TieredCache("quarter_topics", max_entries=64, path=CACHE_PATH)
+
+# Grouped chat counts for the Analytics View's volume charts
+volume_cache = TieredCache("volume_counts", max_entries=64, path=CACHE_PATH)
+
+# Connection pooling and retries for the shared clients
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "300"))
+COSMOS_POOL_SIZE = int(os.getenv("COSMOS_POOL_SIZE", "20"))
+COSMOS_THROTTLE_RETRIES = int(os.getenv("COSMOS_THROTTLE_RETRIES", "9"))
+COSMOS_MAX_RETRY_WAIT = int(os.getenv("COSMOS_MAX_RETRY_WAIT", "30"))
+KEEPALIVE_SECONDS = float(os.getenv("KEEPALIVE_SECONDS", "120"))
+
+# Clients are built on first use and shared by every Streamlit session in the process
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _shared_client(name, build):
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = build()
+        return _clients[name]
+
+
+def _drop_client(name):
+    """Forget a shared client so the next use rebuilds it."""
+    with _clients_lock:
+        _clients.pop(name, None)
+
+
+def get_llm_client():
+    """
+    Shared Azure OpenAI client over a pooled keep-alive HTTP connection pool;
+    identical requests are answered from the response cache.
+    """
+
+    def build():
+        import httpx
+        from openai import AzureOpenAI
+
+        http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=LLM_POOL_SIZE,
+                max_keepalive_connections=LLM_POOL_SIZE,
+                keepalive_expiry=KEEPALIVE_SECONDS,
+            ),
+            timeout=LLM_REQUEST_TIMEOUT,
+        )
+        return CachedLLMClient(
+            AzureOpenAI(
+                azure_endpoint=os.getenv("LLM_ENDPOINT"),
+                api_key=os.getenv("LLM_KEY"),
+                api_version="2024-10-01-preview",
+                http_client=http_client,
+                max_retries=LLM_MAX_RETRIES,
+            ),
+            TieredCache(
+                "llm_responses",
+                max_entries=LLM_CACHE_SIZE,
+                path=CACHE_PATH if LLM_CACHE_DISK else None,
+            ),
+        )
+
+    return _shared_client("llm", build)
+
+
+def get_container():
+    """
+    Shared Cosmos DB container client over a pooled keep-alive session; the SDK
+    retries throttled (429) requests up to COSMOS_THROTTLE_RETRIES times.
+    """
+
+    def build():
+        import requests
+        from requests.adapters import HTTPAdapter
+        from azure.core.pipeline.transport import RequestsTransport
+        from azure.cosmos import CosmosClient
+
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=COSMOS_POOL_SIZE, pool_maxsize=COSMOS_POOL_SIZE
+        )
+        session.mount("https://", adapter)
+        client = CosmosClient(
+            ENDPOINT,
+            KEY,
+            transport=RequestsTransport(session=session, session_owner=False),
+            retry_total=COSMOS_THROTTLE_RETRIES,
+            retry_backoff_max=COSMOS_MAX_RETRY_WAIT,
+        )
+        database = client.get_database_client(DATABASE_NAME)
+        return database.get_container_client(CONTAINER_NAME)
+
+    return _shared_client("container", build)
+
+
+def get_job_queue():
+    """Shared background job queue; worker processes start on the first job."""
+    return _shared_client(
+        "jobs", lambda: JobQueue(JOB_QUEUE_PATH, JOB_WORKERS, JOB_RESULT_TTL, JOB_TIMEOUT)
+    )
+
+
+def check_health():
+    """
+    Probe Cosmos DB and Azure OpenAI with cheap requests. Returns
+    {service: {"ok", "latency_ms", "error"}}; failed clients are rebuilt on next use.
+    """
+    probes = {
+        "cosmos": ("container", lambda: get_container().read()),
+        "llm": ("llm", lambda: get_llm_client().models.list()),
+    }
+    health = {}
+    for service, (client_name, probe) in probes.items():
+        start = time.perf_counter()
+        try:
+            probe()
+            health[service] = {"ok": True, "error": None}
+        except Exception as e:
+            _drop_client(client_name)
+            health[service] = {"ok": False, "error": str(e)}
+        health[service]["latency_ms"] = (time.perf_counter() - start) * 1000
+    return health
+
+
+def __getattr__(name):
+    # `from cloud_config import llmclient` still works, built on first access
+    if name == "llmclient":
+        return get_llm_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,124 @@
+import tracing
+from dedup import compact_titles
+from topicmodelling_dev import fit_topics, format_topics, interpret_topics_with_llm
+
+# numpy is imported on first use to keep app startup fast
+
+
+def topic_shares(period_titles, max_topics=8, max_top_words=10):
+    """
+    Fit one TF-IDF/NMF topic basis over the preprocessed titles of every period
+    and project each period onto it. period_titles maps period name to titles,
+    in display order. Returns (topics, shares): shares is a periods-by-topics array
+    of each topic's share of the period's titles (rows sum to 1, or 0 if empty).
+    """
+    import numpy as np
+
+    names = list(period_titles)
+    documents, counts, period_index = [], [], []
+    for index, name in enumerate(names):
+        for title, count in compact_titles(title for title in period_titles[name] if title):
+            documents.append(title)
+            counts.append(count)
+            period_index.append(index)
+
+    topics, doc_topic = fit_topics(
+        documents, max_topics, max_top_words, refit=True, preprocessed=True, counts=counts
+    )
+    if not topics:
+        return [], np.zeros((len(names), 0))
+
+    with tracing.span("project_periods", periods=len(names), documents=len(documents)):
+        # Each title splits its count across topics in proportion to its weights
+        weights = doc_topic / np.maximum(doc_topic.sum(axis=1, keepdims=True), 1e-12)
+        weights *= np.asarray(counts, dtype=float)[:, None]
+        totals = np.zeros((len(names), len(topics)))
+        np.add.at(totals, np.asarray(period_index), weights)
+        shares = totals / np.maximum(totals.sum(axis=1, keepdims=True), 1e-12)
+    return topics, shares
+
+
+def share_changes(shares):
+    """
+    Period-over-period changes of topic shares: (deltas, growth), both
+    (periods - 1)-by-topics. Growth is relative to the earlier share and NaN
+    where that share was zero.
+    """
+    import numpy as np
+
+    previous, current = shares[:-1], shares[1:]
+    deltas = current - previous
+    growth = np.divide(
+        deltas, previous, out=np.full_like(deltas, np.nan), where=previous > 0
+    )
+    return deltas, growth
+
+
+def label_shared_topics(topics, sample_text):
+    """One LLM call labeling every shared topic; falls back to top keywords."""
+    labels = {
+        item["topic"]: item["label"]
+        for item in interpret_topics_with_llm(sample_text, format_topics(topics))
+    }
+    return [
+        labels.get(number)
+        or ", ".join(keyword["term"] for keyword in topic["keywords"][:3])
+        for number, topic in enumerate(topics, start=1)
+    ]
+
+
+def compare_titles(period_titles, totals=None, max_topics=8):
+    """
+    Shared-basis comparison of periods as a JSON-serializable dict with
+    periods, document totals, topic labels, shares, deltas and growth (NaN
+    growth as None). totals maps periods to their full title counts when
+    period_titles holds samples.
+    """
+    periods = list(period_titles)
+    comparison = {
+        "periods": periods,
+        "documents": [
+            (totals or {}).get(name, len(period_titles[name])) for name in periods
+        ],
+        "labels": [],
+        "shares": [],
+        "deltas": [],
+        "growth": [],
+    }
+    topics, shares = topic_shares(period_titles, max_topics=max_topics)
+    if not topics:
+        return comparison
+
+    deltas, growth = share_changes(shares)
+    sample = "\n".join(title for titles in period_titles.values() for title in titles[:20])
+    comparison.update(
+        labels=label_shared_topics(topics, sample),
+        shares=shares.round(4).tolist(),
+        deltas=deltas.round(4).tolist(),
+        growth=[
+            [None if value != value else round(float(value), 4) for value in row]
+            for row in growth
+        ],
+    )
+    return comparison
+
+
+def comparison_frames(comparison):
+    """
+    (shares, changes) DataFrames for display: shares in percent per period and
+    topic, and per topic the latest share, its change in percentage points and
+    its relative growth against the previous period.
+    """
+    import pandas as pd
+
+    shares = pd.DataFrame(
+        comparison["shares"], index=comparison["periods"], columns=comparison["labels"]
+    ) * 100
+    changes = pd.DataFrame({"Share (%)": shares.iloc[-1].round(1)})
+    if len(comparison["periods"]) > 1:
+        changes["Change (pp)"] = [round(delta * 100, 1) for delta in comparison["deltas"][-1]]
+        changes["Growth (%)"] = [
+            None if growth is None else round(growth * 100, 1)
+            for growth in comparison["growth"][-1]
+        ]
+    return shares, changes.sort_values("Share (%)", ascending=False)
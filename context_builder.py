@@ -0,0 +1,154 @@
+import math
+from collections import Counter, defaultdict
+
+from cloud_config import CHAT_CONTEXT_TOKENS, CHAT_HISTORY_TOKENS, SEMANTIC_TOP_K
+from dedup import format_counted
+from preprocessor import preprocess_text
+from prompts import compact_prompt, count_tokens, fit_titles
+
+SYSTEM_PROMPT = "You are an expert product analyst who analyses software products based on the user statistics from user database."
+
+
+def _tokenize(text):
+    return text.lower().split()
+
+
+class BM25Index:
+    """Inverted index over titles, ranked with Okapi BM25."""
+
+    def __init__(self, titles, k1=1.5, b=0.75):
+        self.titles = titles
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for doc_id, title in enumerate(titles):
+            terms = _tokenize(title)
+            self.lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings[term].append((doc_id, tf))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+
+    def search(self, query, k=50):
+        """
+        Indices of the k best-matching titles, best first. The query is cleaned
+        like the indexed titles (punctuation and stopwords removed).
+        """
+        n_docs = len(self.titles)
+        scores = defaultdict(float)
+        for term in set(_tokenize(preprocess_text(query))):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / self.average_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores, key=scores.get, reverse=True)[:k]
+
+
+def compute_stats(chats, total):
+    """Compact summary of the fetched range, computed once per fetch."""
+    timestamps = sorted(chat["TimeStamp"] for chat in chats if chat.get("TimeStamp"))
+    assistants = Counter(chat.get("AssistantName") or "(Unknown)" for chat in chats)
+    lines = [f"Chats in range: {total}"]
+    if timestamps:
+        lines.append(f"Period: {timestamps[0][:10]} to {timestamps[-1][:10]}")
+    lines.append(
+        "Top assistants: "
+        + ", ".join(f"{name} ({count})" for name, count in assistants.most_common(5))
+    )
+    return "\n".join(lines)
+
+
+def format_topic_labels(topics):
+    """One line per interpreted topic."""
+    if not isinstance(topics, list):
+        return str(topics or "")
+    return "\n".join(
+        f"- {topic.get('label', '')}: {topic.get('description', '')}"
+        for topic in topics
+        if isinstance(topic, dict)
+    )
+
+
+def select_titles(prompt, titles, index, budget, semantic_index=None):
+    """
+    Titles relevant to the prompt within a token budget: semantic or BM25 matches
+    first, topped up with an even spread of the remaining titles.
+    """
+    if semantic_index is not None:
+        ranked = semantic_index.search_text(prompt, k=SEMANTIC_TOP_K)
+    else:
+        ranked = [titles[i] for i in index.search(prompt, k=len(titles))]
+
+    selected = fit_titles(ranked, budget, ranked=True)
+    remaining = budget - sum(count_tokens(title) + 1 for title in selected)
+    if remaining > 0 and len(selected) < len(titles):
+        # Broad questions match few titles; add a representative spread
+        chosen = set(selected)
+        others = [title for title in titles if title not in chosen]
+        selected.extend(fit_titles(others, remaining))
+    return selected
+
+
+def trim_history(messages, budget=CHAT_HISTORY_TOKENS):
+    """Most recent messages that fit in the history budget, oldest first."""
+    kept, used = [], 0
+    for message in reversed(messages):
+        tokens = count_tokens(message.get("content", ""))
+        if used + tokens > budget:
+            break
+        kept.append({"role": message["role"], "content": message["content"]})
+        used += tokens
+    return kept[::-1]
+
+
+def build_chat_messages(
+    prompt,
+    titles,
+    index,
+    topics,
+    stats,
+    history,
+    budget=CHAT_CONTEXT_TOKENS,
+    semantic_index=None,
+    counts=None,
+):
+    """
+    Chat messages with retrieved titles, stats, topics and trimmed history.
+    counts maps compacted titles to their number of occurrences.
+    """
+    selected = select_titles(prompt, titles, index, budget, semantic_index=semantic_index)
+    if counts:
+        selected = format_counted((title, counts.get(title, 1)) for title in selected)
+    relevant_titles = "\n".join(selected)
+    return (
+        [{"role": "system", "content": SYSTEM_PROMPT}]
+        + trim_history(history)
+        + [
+            {
+                "role": "user",
+                "content": compact_prompt(
+                    f"""
+                Answer the user's prompt based on the following data from the database.
+                The database contains usage history of user questions and AI responses from an AI-assisted chatbot interface, specifically used for legal advice.
+
+                Statistics:
+                {stats}
+
+                Relevant User Chat Titles:
+                {relevant_titles}
+                Highlighted topics:
+                {format_topic_labels(topics)}
+
+                ---
+                Prompt: {prompt}
+
+                ---
+                Intelligently analyze the user's intent in the prompt and provide an insightful answer, utilizing relevant data and context from the chat titles.
+                """
+                ),
+            },
+        ]
+    )
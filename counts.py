@@ -0,0 +1,97 @@
+import logging
+import re
+import threading
+import time
+
+from retry import call_with_backoff
+
+
+def metadata_count(container):
+    """Approximate document count from the container's quota/usage headers."""
+    container.read(populate_quota_info=True)
+    usage = container.client_connection.last_response_headers.get(
+        "x-ms-resource-usage", ""
+    )
+    match = re.search(r"documentsCount=(\d+)", usage)
+    return int(match.group(1)) if match else None
+
+
+def exact_count(container):
+    """Exact document count via a cross-partition COUNT query."""
+    res = call_with_backoff(
+        lambda: list(
+            container.query_items(
+                query="SELECT VALUE COUNT(1) FROM c", enable_cross_partition_query=True
+            )
+        )
+    )
+    return res[0]
+
+
+class DocumentCountProvider:
+    """
+    Document count for the entries slider. Serves a cached exact count while it
+    is fresh, otherwise returns the best available approximation immediately
+    (stale exact count, local store count, or container metadata) and refreshes
+    the exact count in a background thread.
+    """
+
+    def __init__(self, ttl=300, local_store=None):
+        self.ttl = ttl
+        self.local_store = local_store
+        self._exact = None
+        self._exact_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def get(self, container):
+        with self._lock:
+            exact, fresh = self._exact, time.monotonic() - self._exact_at < self.ttl
+        if exact is not None and fresh:
+            return exact
+
+        if exact is not None:
+            self._refresh_in_background(container)
+            return exact
+
+        approximate = self._approximate(container)
+        if approximate:
+            self._refresh_in_background(container)
+            return approximate
+        # Nothing cheaper available on first use; pay for one exact count
+        return self._refresh(container)
+
+    def _approximate(self, container):
+        if self.local_store is not None:
+            local_count = self.local_store.count()
+            if local_count:
+                return local_count
+        try:
+            return metadata_count(container)
+        except Exception as e:
+            logging.warning(f"Container metadata count unavailable: {e}")
+            return None
+
+    def _refresh(self, container):
+        count = exact_count(container)
+        with self._lock:
+            self._exact = count
+            self._exact_at = time.monotonic()
+        return count
+
+    def _refresh_in_background(self, container):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self._refresh(container)
+            except Exception as e:
+                logging.error(f"Error refreshing document count: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
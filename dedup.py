@@ -0,0 +1,94 @@
+import zlib
+from collections import Counter
+
+from cloud_config import DEDUP_NEAR_DUPLICATES, DEDUP_SIMILARITY
+
+# numpy is imported on first use, only when near-duplicate merging is enabled
+
+# MinHash signature length and LSH bands (rows per band = MINHASH_PERMUTATIONS // LSH_BANDS)
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+
+# Character shingle length for MinHash
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def count_titles(titles):
+    """Collapse exact duplicates into (title, count) pairs, most frequent first."""
+    return Counter(titles).most_common()
+
+
+def _shingles(title):
+    text = " ".join(title.split())
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i : i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash_signatures(titles, num_perm=MINHASH_PERMUTATIONS, seed=42):
+    """MinHash signature per title over character shingles, as an (n, num_perm) array."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+    signatures = np.empty((len(titles), num_perm), dtype=np.uint64)
+    for row, title in enumerate(titles):
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in _shingles(title)), dtype=np.uint64
+        )
+        # 32-bit hashes and 31-bit multipliers keep a * h + b within 64 bits
+        signatures[row] = ((np.outer(a, hashes) + b[:, None]) % _MERSENNE_PRIME).min(axis=1)
+    return signatures
+
+
+def merge_near_duplicates(pairs, threshold=DEDUP_SIMILARITY, bands=LSH_BANDS):
+    """
+    Merge (title, count) pairs whose estimated Jaccard similarity reaches
+    threshold, using MinHash with LSH banding to find candidates. Each group
+    keeps its most frequent title and the summed count.
+    """
+    if len(pairs) < 2:
+        return list(pairs)
+    titles = [title for title, _ in pairs]
+    signatures = minhash_signatures(titles)
+    rows = signatures.shape[1] // bands
+
+    parent = list(range(len(pairs)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        buckets = {}
+        for i, key in enumerate(map(bytes, signatures[:, band * rows : (band + 1) * rows])):
+            j = buckets.setdefault(key, i)
+            if j == i:
+                continue
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j and (signatures[i] == signatures[j]).mean() >= threshold:
+                # Pairs are most frequent first, so the lower index is the representative
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    merged = Counter()
+    for i, (_, count) in enumerate(pairs):
+        merged[titles[find(i)]] += count
+    return merged.most_common()
+
+
+def compact_titles(titles, near_duplicates=DEDUP_NEAR_DUPLICATES):
+    """(title, count) pairs for titles, merging near duplicates when enabled."""
+    pairs = count_titles(titles)
+    if near_duplicates:
+        pairs = merge_near_duplicates(pairs)
+    return pairs
+
+
+def format_counted(pairs):
+    """Prompt lines for (title, count) pairs, marking repeats as "title (xN)"."""
+    return [title if count == 1 else f"{title} (x{count})" for title, count in pairs]
@@ -0,0 +1,292 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import signal
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import tracing
+
+# Job handlers live in analyses.py and are imported by the worker processes only
+
+# Seconds past its deadline before a job that was not interrupted is marked failed
+DEADLINE_GRACE = 10
+
+
+def job_key(kind, params):
+    """Identical analyses (same kind and parameters) share one job id."""
+    payload = json.dumps({"kind": kind, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    with conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT,
+                status TEXT,
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                created REAL,
+                finished REAL,
+                trace TEXT,
+                deadline REAL,
+                params TEXT,
+                timeout REAL
+            )
+            """
+        )
+    for column in ("trace TEXT", "deadline REAL", "params TEXT", "timeout REAL"):
+        try:
+            with conn:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            pass  # Column already present
+    return conn
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError("Job timed out")
+
+
+@contextmanager
+def _time_limit(seconds):
+    """Interrupt the worker's main thread after seconds, where SIGALRM is available."""
+    if not seconds or not hasattr(signal, "SIGALRM"):
+        yield
+        return
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _claim(conn):
+    """
+    Mark the oldest queued job running and return (id, created, kind, params,
+    timeout), or None when the queue is empty. The write transaction keeps two workers
+    from claiming the same job.
+    """
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT id, created, kind, params, timeout FROM jobs WHERE status = 'queued' "
+            "ORDER BY created LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        job_id, created, kind, params, timeout = row
+        conn.execute(
+            "UPDATE jobs SET status = 'running', deadline = ? WHERE id = ?",
+            (time.time() + timeout if timeout else None, job_id),
+        )
+    return job_id, created, kind, json.loads(params or "{}"), timeout
+
+
+def _drain(path):
+    """Worker loop: run queued jobs from the table until none are left."""
+    conn = _connect(path)
+    try:
+        while True:
+            claimed = _claim(conn)
+            if claimed is None:
+                return
+            _execute(conn, *claimed)
+    finally:
+        conn.close()
+
+
+def _execute(conn, job_id, created, kind, params, timeout=None):
+    """
+    Run one claimed job in a worker process and persist its outcome. A job
+    running longer than timeout seconds is interrupted and recorded as failed.
+    """
+    lock = threading.Lock()
+
+    def update(**fields):
+        # A job already failed as timed out (see JobQueue.status) keeps that
+        # outcome, and a resubmitted run (a new created time) is not overwritten
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with lock, conn:
+            conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND created = ? AND status = 'running'",
+                (*fields.values(), job_id, created),
+            )
+
+    def report(message, partial=None):
+        # Partial results are visible to status() while the job runs
+        if partial is None:
+            update(progress=message)
+        else:
+            update(progress=message, result=json.dumps(partial))
+
+    trace = None
+    try:
+        from analyses import JOBS
+        from cloud_config import TRACE_LOG_PATH
+
+        if kind not in JOBS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        with _time_limit(timeout), tracing.start_trace(kind, log_path=TRACE_LOG_PATH) as trace:
+            result = JOBS[kind](progress=report, **params)
+        update(
+            status="done",
+            result=json.dumps(result),
+            trace=json.dumps(trace.to_dict()),
+            finished=time.time(),
+        )
+    except Exception as e:
+        logging.exception(f"Job {kind} failed")
+        update(
+            status="failed",
+            error=str(e),
+            trace=json.dumps(trace.to_dict()) if trace else None,
+            finished=time.time(),
+        )
+
+
+class JobQueue:
+    """
+    Runs expensive analyses in a pool of worker processes. Jobs are recorded in
+    SQLite by a hash of their kind and parameters, so identical requests from
+    any session share one in-flight computation and its persisted result.
+    Workers pull queued jobs from the table, so queued work survives a restart.
+    """
+
+    def __init__(self, path, workers=4, result_ttl=3600, timeout=900):
+        self.path = path
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.timeout = timeout
+        self._executor = None
+        self._drains = set()
+        self._lock = threading.Lock()
+        self._conn = _connect(path)
+        # Jobs running when the previous process exited died with its workers;
+        # queued ones are picked up again below
+        with self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted', finished = ? "
+                "WHERE status = 'running'",
+                (time.time(),),
+            )
+        self._dispatch()
+
+    def _pool(self):
+        if self._executor is None:
+            # Spawned workers start clean instead of forking the app's threads and clients
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _dispatch(self):
+        """Start worker loops for queued jobs, up to one per worker process."""
+        with self._lock:
+            (queued,) = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+            ).fetchone()
+            started = []
+            for _ in range(min(queued, self.workers - len(self._drains))):
+                future = self._pool().submit(_drain, self.path)
+                self._drains.add(future)
+                started.append(future)
+        # Callbacks of futures that are already done run here, outside the lock
+        for future in started:
+            future.add_done_callback(self._on_done)
+
+    def submit(self, kind, ttl=None, retry_after=0, timeout=None, **params):
+        """
+        Queue an analysis and return its job id. An identical job that is queued,
+        running, or finished within ttl seconds (default result_ttl) is reused,
+        as is one that failed within retry_after seconds. The job fails once it
+        has run for timeout seconds (default self.timeout).
+        """
+        job_id = job_key(kind, params)
+        ttl = self.result_ttl if ttl is None else ttl
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT status, finished FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is not None:
+                status, finished = row
+                if status in ("queued", "running"):
+                    return job_id
+                if status == "done" and time.time() - finished < ttl:
+                    return job_id
+                if status == "failed" and time.time() - finished < retry_after:
+                    return job_id
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, kind, status, created, params, timeout) "
+                "VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, time.time(), json.dumps(params), timeout),
+            )
+        self._dispatch()
+        return job_id
+
+    def _on_done(self, future):
+        """
+        Start another worker loop if jobs were queued while this one finished,
+        and record jobs whose worker died before it could record the outcome.
+        """
+        error = future.exception()
+        with self._lock:
+            self._drains.discard(future)
+            if error is not None:
+                logging.error(f"Job worker failed: {error}")
+                # A broken pool loses every worker and rejects further work;
+                # fail the jobs it was running and build a new one on next use
+                with self._conn:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished = ? "
+                        "WHERE status = 'running'",
+                        (str(error), time.time()),
+                    )
+                self._executor = None
+                self._drains.clear()
+        self._dispatch()
+
+    def status(self, job_id):
+        """
+        {"status", "progress", "result", "error", "trace"} for a job, or None if
+        unknown. result may hold a partial result while the job runs; trace holds
+        the job's per-stage spans once it has finished.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, progress, result, error, trace, deadline FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            status, progress, result, error, trace, deadline = row
+            # Workers without SIGALRM, or stuck outside Python code, are not
+            # interrupted; their jobs fail here once past the deadline
+            now = time.time()
+            if status == "running" and deadline is not None and deadline < now - DEADLINE_GRACE:
+                with self._conn:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = 'Timed out', finished = ? "
+                        "WHERE id = ? AND status = 'running'",
+                        (now, job_id),
+                    )
+                status, error = "failed", "Timed out"
+        return {
+            "status": status,
+            "progress": progress,
+            "result": json.loads(result) if result is not None else None,
+            "error": error,
+            "trace": json.loads(trace) if trace is not None else None,
+        }
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import tracing
+from retry import call_with_backoff
+
+# Request options that change transport behaviour but not the generated text
+_UNKEYED_OPTIONS = ("stream", "timeout")
+
+
+def request_key(**kwargs):
+    """Hash of the generation request (model, messages, temperature, ...)."""
+    keyed = {k: v for k, v in kwargs.items() if k not in _UNKEYED_OPTIONS}
+    payload = json.dumps(keyed, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _count_tokens(texts):
+    from prompts import count_tokens
+
+    return sum(count_tokens(text) for text in texts)
+
+
+def _completion(chunks):
+    """Build a minimal non-streamed completion object from cached chunks."""
+    message = SimpleNamespace(role="assistant", content="".join(chunks))
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def _replay_stream(chunks):
+    """Replay cached chunks in the same shape as streamed completion chunks."""
+    for text in chunks:
+        delta = SimpleNamespace(role="assistant", content=text)
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+
+
+class CachedLLMClient:
+    """
+    Wraps an OpenAI client so identical chat completion requests are answered
+    from cache, both streamed and non-streamed.
+    """
+
+    def __init__(self, client, cache):
+        self._client = client
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def create(self, cache=True, validate=None, **kwargs):
+        """
+        chat.completions.create through the cache. With cache=False the request
+        neither reads nor writes the cache; with validate, a response is only
+        cached when validate(content) is true.
+        """
+        key = request_key(**kwargs)
+        stream = kwargs.get("stream", False)
+
+        chunks = self.cache.get(key) if cache else None
+        if chunks is not None:
+            self._count(hit=True)
+            tracing.add(llm_cache_hits=1)
+            return _replay_stream(chunks) if stream else _completion(chunks)
+
+        self._count(hit=False)
+        tracing.add(llm_cache_misses=1)
+        started = time.perf_counter()
+        # Sustained throttling outlasts the SDK's own retries; back off with jitter
+        response = call_with_backoff(self._client.chat.completions.create, **kwargs)
+        if stream:
+            return self._record_stream(
+                key, response, kwargs.get("messages", []), started, cache, validate
+            )
+        content = response.choices[0].message.content or ""
+        usage = getattr(response, "usage", None)
+        tracing.add(
+            llm_calls=1,
+            llm_ms=(time.perf_counter() - started) * 1000,
+            llm_prompt_tokens=getattr(usage, "prompt_tokens", None)
+            or _count_tokens(m.get("content") or "" for m in kwargs.get("messages", [])),
+            llm_completion_tokens=getattr(usage, "completion_tokens", None)
+            or _count_tokens([content]),
+        )
+        if cache and (validate is None or validate(content)):
+            self.cache.set(key, [content])
+        return response
+
+    def _record_stream(self, key, response_stream, messages, started, cache=True, validate=None):
+        """Pass chunks through while recording them; cache only complete (and valid) streams."""
+        chunks = []
+        for chunk in response_stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if not chunks:
+                    tracing.add(llm_ttft_ms=(time.perf_counter() - started) * 1000)
+                chunks.append(chunk.choices[0].delta.content)
+            yield chunk
+        tracing.add(
+            llm_calls=1,
+            llm_ms=(time.perf_counter() - started) * 1000,
+            llm_prompt_tokens=_count_tokens(m.get("content") or "" for m in messages),
+            llm_completion_tokens=_count_tokens(chunks),
+        )
+        if cache and (validate is None or validate("".join(chunks))):
+            self.cache.set(key, chunks)
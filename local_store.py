@@ -0,0 +1,183 @@
+import logging
+import sqlite3
+import threading
+import time
+
+from tracing import record_cosmos_page, record_request_charge
+
+_COLUMNS = ("id", "TimeStamp", "AssistantName", "ChatTitle")
+
+# Grouping expressions available to group_counts
+_GROUPINGS = {"assistant": "assistant", "day": "substr(ts, 1, 10)"}
+
+
+class LocalChatStore:
+    """
+    Local SQLite copy of the chat documents (id, TimeStamp, AssistantName,
+    ChatTitle), kept up to date incrementally from Cosmos DB using a _ts
+    high-water mark. Date-range and offset/limit queries are answered locally
+    once a first full sync has completed (see ready()).
+    """
+
+    def __init__(self, path, sync_interval=300):
+        self.path = path
+        self.sync_interval = sync_interval
+        self._last_sync = 0.0
+        self._ready = False
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS chats (
+                    id TEXT PRIMARY KEY,
+                    ts TEXT,
+                    assistant TEXT,
+                    title TEXT,
+                    cosmos_ts INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS idx_chats_ts ON chats (ts);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                """
+            )
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def watermark(self):
+        """Highest Cosmos _ts already stored locally."""
+        row = self._query("SELECT value FROM meta WHERE key = 'watermark'")
+        return int(row[0][0]) if row else 0
+
+    def ready(self):
+        """Whether a full sync has completed, so the store holds every document."""
+        if not self._ready:
+            self._ready = bool(self._query("SELECT 1 FROM meta WHERE key = 'synced'"))
+        return self._ready
+
+    def sync(self, container, page_size=1000, progress=None):
+        """
+        Pull documents changed since the watermark and return how many were
+        stored. progress, if given, is called with a status message per page.
+        """
+        with self._sync_lock:
+            watermark = self.watermark()
+            # >= rather than >: documents written in the same second as the last
+            # sync may have been missed; re-upserting them is harmless. Pages come
+            # in _ts order, so the watermark saved after each page never skips
+            # unread documents when a sync fails partway
+            pages = container.query_items(
+                query="SELECT c.id, c.TimeStamp, c.AssistantName, c.ChatTitle, c._ts FROM c WHERE c._ts >= @watermark ORDER BY c._ts ASC",
+                parameters=[{"name": "@watermark", "value": watermark}],
+                enable_cross_partition_query=True,
+                max_item_count=page_size,
+                response_hook=record_request_charge,
+            ).by_page()
+
+            synced = 0
+            for page in pages:
+                rows = [
+                    (
+                        doc["id"],
+                        doc.get("TimeStamp"),
+                        doc.get("AssistantName"),
+                        doc.get("ChatTitle"),
+                        doc.get("_ts", 0),
+                    )
+                    for doc in page
+                ]
+                record_cosmos_page(len(rows))
+                if not rows:
+                    continue
+                watermark = max(watermark, max(row[4] for row in rows))
+                with self._lock, self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO chats (id, ts, assistant, title, cosmos_ts) VALUES (?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES ('watermark', ?)",
+                        (str(watermark),),
+                    )
+                synced += len(rows)
+                if progress:
+                    progress(f"Synced {synced} documents...")
+
+            with self._lock, self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('synced', '1')")
+            self._ready = True
+            self._last_sync = time.monotonic()
+            logging.info(f"Local store sync: {synced} documents, watermark {watermark}")
+            return synced
+
+    def sync_if_stale(self, container):
+        """
+        Sync unless the last attempt was within sync_interval seconds; a failed
+        sync is not retried before then either.
+        """
+        if time.monotonic() - self._last_sync >= self.sync_interval:
+            self._last_sync = time.monotonic()
+            self.sync(container)
+
+    def iter_range(self, start_ts, end_ts, batch_size=1000):
+        """Stream documents with start_ts <= TimeStamp <= end_ts, newest first."""
+        # A dedicated read connection keeps the shared one free while streaming
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute(
+                "SELECT id, ts, assistant, title FROM chats WHERE ts BETWEEN ? AND ? ORDER BY ts DESC",
+                (start_ts, end_ts),
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(_COLUMNS, row))
+        finally:
+            conn.close()
+
+    def query_latest(self, offset, limit):
+        """Documents ordered newest first, skipping offset and returning up to limit."""
+        rows = self._query(
+            "SELECT id, ts, assistant, title FROM chats ORDER BY ts DESC LIMIT ? OFFSET ?",
+            (limit, offset),
+        )
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def fingerprint(self, start_ts, end_ts):
+        """Document count and latest _ts in a TimeStamp range."""
+        count, max_ts = self._query(
+            "SELECT COUNT(*), MAX(cosmos_ts) FROM chats WHERE ts BETWEEN ? AND ?",
+            (start_ts, end_ts),
+        )[0]
+        return {"count": count, "max_ts": max_ts}
+
+    def group_counts(self, start_ts, end_ts, by):
+        """Document counts in a TimeStamp range grouped by "assistant" or "day"."""
+        expression = _GROUPINGS[by]
+        return self._query(
+            f"SELECT {expression} AS key, COUNT(*) FROM chats WHERE ts BETWEEN ? AND ? GROUP BY key ORDER BY key",
+            (start_ts, end_ts),
+        )
+
+    def count(self):
+        return self._query("SELECT COUNT(*) FROM chats")[0][0]
+
+
+def main():
+    """Run a full sync from the command line, e.g. before the app's first start."""
+    from cloud_config import get_container, local_store
+
+    logging.basicConfig(level=logging.INFO)
+    if local_store is None:
+        print("The local store is disabled (LOCAL_STORE_ENABLED=0)")
+        return
+    synced = local_store.sync(get_container(), progress=print)
+    print(f"Synced {synced} documents into {local_store.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import bisect
+import logging
+import threading
+import time
+
+from tracing import record_cosmos_page, record_request_charge
+
+
+class PageCursorCache:
+    """
+    Remembers Cosmos continuation tokens by the absolute row position they
+    resume from, per (query, page_size), so deep offsets can resume from the
+    nearest known cursor instead of rescanning skipped rows. Each query is
+    pinned to an anchor _ts for ttl seconds (see iter_pages), so documents
+    written after the anchor do not shift row positions under saved cursors.
+    """
+
+    def __init__(self, max_queries=32, ttl=600):
+        self.max_queries = max_queries
+        self.ttl = ttl
+        self._cursors = {}
+        self._lock = threading.Lock()
+
+    def start(self, query, page_size, offset):
+        """
+        Return (anchor, position, token): the query's live anchor _ts and the
+        closest cursor at or before offset, starting a new anchor once it expires.
+        """
+        with self._lock:
+            key = (query, page_size)
+            entry = self._cursors.get(key)
+            if entry is None or time.monotonic() - entry[0] >= self.ttl:
+                if entry is None and len(self._cursors) >= self.max_queries:
+                    self._cursors.pop(next(iter(self._cursors)))
+                entry = (time.monotonic(), int(time.time()), {})
+                self._cursors[key] = entry
+            _, anchor, cursors = entry
+            positions = sorted(cursors)
+            index = bisect.bisect_right(positions, offset) - 1
+            if index < 0:
+                return anchor, 0, None
+            return anchor, positions[index], cursors[positions[index]]
+
+    def set(self, query, page_size, anchor, position, token):
+        with self._lock:
+            entry = self._cursors.get((query, page_size))
+            # Cursors of an expired anchor would resume a different snapshot
+            if entry is not None and entry[1] == anchor:
+                entry[2][position] = token
+
+    def forget(self, query, page_size, anchor):
+        with self._lock:
+            entry = self._cursors.get((query, page_size))
+            if entry is not None and entry[1] == anchor:
+                entry[2].clear()
+
+
+def iter_pages(container, query, offset, limit, cursors, page_size=1000):
+    """
+    Yield lists of items covering rows [offset, offset + limit) of an ORDER BY
+    query, page by page, using continuation tokens rather than OFFSET/LIMIT.
+    The query must filter on c._ts <= @anchor; the anchor is fixed per query
+    for the cursor cache's ttl, so paging reads a stable snapshot and cached
+    cursors stay valid until it moves.
+    """
+    anchor, position, token = cursors.start(query, page_size, offset)
+    yielded = False
+    try:
+        for items in _iter_from(
+            container, query, offset, limit, cursors, page_size, anchor, position, token
+        ):
+            yielded = True
+            yield items
+    except Exception as e:
+        if token is None or yielded:
+            raise
+        # A stale continuation token; drop cached cursors and scan from the start
+        logging.warning(f"Continuation token rejected, restarting scan: {e}")
+        cursors.forget(query, page_size, anchor)
+        yield from _iter_from(
+            container, query, offset, limit, cursors, page_size, anchor, 0, None
+        )
+
+
+def _iter_from(container, query, offset, limit, cursors, page_size, anchor, position, token):
+    pager = container.query_items(
+        query=query,
+        parameters=[{"name": "@anchor", "value": anchor}],
+        enable_cross_partition_query=True,
+        max_item_count=page_size,
+        response_hook=record_request_charge,
+    ).by_page(token)
+
+    end = offset + limit
+    for page in pager:
+        items = list(page)
+        record_cosmos_page(len(items))
+        page_start = position
+        position += len(items)
+        if pager.continuation_token:
+            cursors.set(query, page_size, anchor, position, pager.continuation_token)
+
+        if position > offset:
+            selected = items[max(offset - page_start, 0) : end - page_start]
+            if selected:
+                yield selected
+        if position >= end or not pager.continuation_token:
+            return
@@ -0,0 +1,53 @@
+import random
+
+from preprocessor import iter_preprocessed_titles
+from tracing import record_cosmos_page, record_request_charge
+
+
+def iter_documents(container, query, page_size=1000, parameters=None):
+    """Stream query results page by page instead of materializing them."""
+    pages = container.query_items(
+        query=query,
+        parameters=parameters,
+        enable_cross_partition_query=True,
+        max_item_count=page_size,
+        response_hook=record_request_charge,
+    ).by_page()
+    for page in pages:
+        page = list(page)
+        record_cosmos_page(len(page))
+        yield from page
+
+
+def iter_truncated(docs, max_chars):
+    """Fill in missing titles and truncate ChatTitle to max_chars, in place."""
+    for doc in docs:
+        doc["ChatTitle"] = (doc.get("ChatTitle") or "(No Title)")[:max_chars]
+        yield doc
+
+
+def iter_preprocessed(titles):
+    """Clean each title and drop the ones left empty."""
+    for processed in iter_preprocessed_titles(titles, cache=True):
+        if processed:
+            yield processed
+
+
+def reservoir_sample(items, max_items, seed=42):
+    """
+    Keep at most max_items from a stream as a uniform random sample, preserving
+    stream order. Returns (sample, total number of items seen).
+    """
+    rng = random.Random(seed)
+    reservoir = []
+    total = 0
+    for item in items:
+        if len(reservoir) < max_items:
+            reservoir.append((total, item))
+        else:
+            slot = rng.randint(0, total)
+            if slot < max_items:
+                reservoir[slot] = (total, item)
+        total += 1
+    reservoir.sort(key=lambda pair: pair[0])
+    return [item for _, item in reservoir], total
@@ -0,0 +1,118 @@
+import hashlib
+import logging
+import os
+import re
+
+from cloud_config import (
+    LLM_LARGE_MODEL,
+    LLM_SMALL_MODEL,
+    LLM_SMALL_MODEL_MAX_TOKENS,
+    TIKTOKEN_CACHE_DIR,
+    TOKEN_ENCODING,
+)
+
+# Tokens of chat framing per message (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Where tiktoken publishes the encoding files of the OpenAI encodings
+ENCODING_URL = "https://openaipublic.blob.core.windows.net/encodings/{}.tiktoken"
+
+# The tokenizer is loaded on first use; without tiktoken (or its encoding
+# files) token counts fall back to an estimate
+_encoding = None
+_encoding_loaded = False
+
+
+def _encoding_cached():
+    """Whether TOKEN_ENCODING's file is in TIKTOKEN_CACHE_DIR (tiktoken names it by URL hash)."""
+    name = hashlib.sha1(ENCODING_URL.format(TOKEN_ENCODING).encode()).hexdigest()
+    return os.path.exists(os.path.join(TIKTOKEN_CACHE_DIR, name))
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            # tiktoken would otherwise download a missing file, without a timeout
+            if not _encoding_cached():
+                raise FileNotFoundError(
+                    f"{TOKEN_ENCODING} not in {TIKTOKEN_CACHE_DIR}; run python prompts.py"
+                )
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception as e:
+            logging.warning(f"tiktoken unavailable, estimating token counts: {e}")
+        _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text):
+    """Tokens in text with the model's tokenizer, or about 4 characters per token without it."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages):
+    """Prompt tokens of a list of chat messages."""
+    return sum(
+        count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+        for message in messages
+    )
+
+
+def compact_prompt(text):
+    """Prompt text without indentation, trailing spaces or runs of blank lines."""
+    lines = [line.strip() for line in text.strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+def _fill(titles, costs, budget):
+    selected, used = [], 0
+    for title, tokens in zip(titles, costs):
+        if used + tokens > budget:
+            break
+        selected.append(title)
+        used += tokens
+    return selected
+
+
+def fit_titles(titles, budget, ranked=False):
+    """
+    Titles that fit in budget tokens, one per line. Ranked titles (best first)
+    keep their best prefix; otherwise an even spread of the titles is kept, in
+    order, so the sample covers the whole list.
+    """
+    titles = list(titles)
+    costs = [count_tokens(title) + 1 for title in titles]
+    total = sum(costs)
+    if total <= budget:
+        return titles
+    if ranked or budget <= 0:
+        return _fill(titles, costs, budget)
+    step = -(-total // budget)
+    return _fill(titles[::step], costs[::step], budget)
+
+
+def choose_model(messages):
+    """
+    Model tier for a request by prompt size: LLM_SMALL_MODEL up to
+    LLM_SMALL_MODEL_MAX_TOKENS, LLM_LARGE_MODEL for longer prompts.
+    """
+    if count_message_tokens(messages) <= LLM_SMALL_MODEL_MAX_TOKENS:
+        return LLM_SMALL_MODEL
+    return LLM_LARGE_MODEL
+
+
+def main():
+    """Download TOKEN_ENCODING into TIKTOKEN_CACHE_DIR, e.g. while deploying."""
+    import tiktoken
+
+    tiktoken.get_encoding(TOKEN_ENCODING)
+    print(f"Cached {TOKEN_ENCODING} in {TIKTOKEN_CACHE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Precompute quarterly reports (top topics, NMF topics and trend analysis) so the
+Analytics View can show them without running the analyses live.
+
+Usage:
+    python reports.py --years 2023 2024 [--workers 4] [--force]
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta, timezone
+
+from cloud_config import REPORT_DIR, JOB_WORKERS, CURRENT_QUARTER_TTL, local_store, get_container
+
+# Bump when report contents or their prompts change; older artifacts are ignored
+REPORT_VERSION = "3"
+
+QUARTERS = {
+    "Q1": ("01/01", "03/31"),
+    "Q2": ("04/01", "06/30"),
+    "Q3": ("07/01", "09/30"),
+    "Q4": ("10/01", "12/31"),
+}
+
+
+def quarter_periods(years):
+    """(period, start_date, end_date) for each started quarter of the given years."""
+    periods = []
+    for year in years:
+        for quarter, (start, end) in QUARTERS.items():
+            start_date = f"{year}/{start}"
+            if datetime.strptime(start_date, "%Y/%m/%d").date() > date.today():
+                continue
+            periods.append((f"{year}-{quarter}", start_date, f"{year}/{end}"))
+    return periods
+
+
+def month_periods(years):
+    """(period, start_date, end_date) for each started month of the given years."""
+    periods = []
+    for year in years:
+        for month in range(1, 13):
+            start = date(year, month, 1)
+            if start > date.today():
+                continue
+            end = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+            periods.append((f"{year}-{month:02d}", start.strftime("%Y/%m/%d"), end.strftime("%Y/%m/%d")))
+    return periods
+
+
+def _path(period):
+    return os.path.join(REPORT_DIR, f"v{REPORT_VERSION}", f"{period}.json")
+
+
+def load_report(period):
+    try:
+        with open(_path(period), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def current_report(period, end_date):
+    """
+    The stored report for a period if it is still valid: generated after the
+    period closed, or less than CURRENT_QUARTER_TTL seconds ago.
+    """
+    report = load_report(period)
+    if report is None:
+        return None
+    generated_at = datetime.fromisoformat(report["generated_at"])
+    period_end = datetime.strptime(end_date, "%Y/%m/%d").replace(tzinfo=timezone.utc)
+    if generated_at.date() > period_end.date():
+        return report
+    age = (datetime.now(timezone.utc) - generated_at).total_seconds()
+    return report if age < CURRENT_QUARTER_TTL else None
+
+
+def _write_report(period, report):
+    path = _path(period)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename so the dashboard never reads a partial file
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(report, f)
+    os.replace(path + ".tmp", path)
+
+
+def build_report(period, start_date, end_date, fingerprint=None):
+    """Run every analysis for one period and write its report; runs in a worker process."""
+    from analyses import period_bounds, period_titles, quarter_topics, trend_analysis
+    from dedup import compact_titles, format_counted
+    from topicmodelling_dev import extract_topics
+
+    processed_titles, total = period_titles(*period_bounds(start_date, end_date))
+    title_counts = compact_titles(processed_titles)
+    report = {
+        "report_version": REPORT_VERSION,
+        "period": period,
+        "start_date": start_date,
+        "end_date": end_date,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "fingerprint": fingerprint,
+        "documents": total,
+        "top_topics": "No data available",
+        "topics": [],
+        "trend_analysis": "",
+    }
+    if processed_titles:
+        report["top_topics"] = quarter_topics(
+            start_date, end_date, processed_titles=processed_titles
+        )
+        report["topics"] = extract_topics(
+            [title for title, _ in title_counts],
+            preprocessed=True,
+            counts=[count for _, count in title_counts],
+        )
+        report["trend_analysis"] = trend_analysis(format_counted(title_counts))
+    _write_report(period, report)
+    return report
+
+
+def refresh_reports(years, workers=JOB_WORKERS, force=False):
+    """
+    Build reports for each quarter of years in a pool of worker processes,
+    skipping quarters whose stored report matches the data's fingerprint.
+    Returns the periods that were rebuilt.
+    """
+    from analyses import period_bounds, period_fingerprint
+
+    if local_store is not None:
+        # Sync once here so the workers only read the local store
+        local_store.sync_if_stale(get_container())
+
+    pending = []
+    for period, start_date, end_date in quarter_periods(years):
+        fingerprint = period_fingerprint(*period_bounds(start_date, end_date))
+        existing = load_report(period)
+        if not force and existing is not None and existing["fingerprint"] == fingerprint:
+            continue
+        pending.append((period, start_date, end_date, fingerprint))
+
+    built = []
+    if not pending:
+        return built
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = {executor.submit(build_report, *args): args[0] for args in pending}
+        for future in as_completed(futures):
+            period = futures[future]
+            try:
+                future.result()
+                built.append(period)
+                logging.info(f"Built report {period}")
+            except Exception as e:
+                logging.error(f"Report {period} failed: {e}")
+    return sorted(built)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute quarterly analytics reports.")
+    parser.add_argument(
+        "--years", type=int, nargs="+", default=[date.today().year], help="Years to report on"
+    )
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS, help="Worker processes")
+    parser.add_argument("--force", action="store_true", help="Rebuild unchanged reports too")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    built = refresh_reports(args.years, workers=args.workers, force=args.force)
+    print(f"Built {len(built)} reports in {os.path.join(REPORT_DIR, f'v{REPORT_VERSION}')}")
+
+
+if __name__ == "__main__":
+    main()
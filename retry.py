@@ -0,0 +1,41 @@
+import logging
+import random
+import time
+
+
+def _retry_after(error):
+    """Server-suggested wait in seconds from a throttling error, if any."""
+    headers = getattr(error, "headers", None)
+    if headers is None and getattr(error, "response", None) is not None:
+        headers = error.response.headers
+    if not headers:
+        return None
+    if headers.get("x-ms-retry-after-ms"):
+        return float(headers["x-ms-retry-after-ms"]) / 1000
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            return None
+    return None
+
+
+def is_throttled(error):
+    return getattr(error, "status_code", None) == 429
+
+
+def call_with_backoff(fn, *args, attempts=5, base_delay=1.0, max_delay=30.0, **kwargs):
+    """
+    Call fn, retrying 429 throttling errors with exponential backoff and full
+    jitter. A server-provided retry-after is used as the minimum wait.
+    """
+    for attempt in range(attempts):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if not is_throttled(e) or attempt == attempts - 1:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2**attempt))
+            delay = max(delay, _retry_after(e) or 0)
+            logging.warning(f"Throttled (429), retrying in {delay:.1f}s")
+            time.sleep(delay)
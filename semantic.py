@@ -0,0 +1,368 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from cloud_config import EMBEDDING_MODEL, EMBEDDING_DIR, EMBEDDING_BATCH_SIZE, JOB_RESULT_TTL
+
+# Title counts above which the retrieval index is partitioned (IVF)
+IVF_THRESHOLD = 20000
+
+# Titles per SQLite lookup, below the default host-parameter limit
+_LOOKUP_CHUNK = 500
+
+# Embedding rows read from the memory map per scoring step
+_SCORE_CHUNK = 4096
+
+
+def _title_hash(title):
+    return hashlib.sha1(title.encode("utf-8")).hexdigest()
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class EmbeddingStore:
+    """
+    Title embeddings from a local CPU model, cached by title hash in an
+    append-only memory-mapped float32 matrix so each title is embedded once.
+    Several processes (the app and job workers) may share one store.
+    """
+
+    def __init__(self, directory, model_name, batch_size=64):
+        directory = os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._matrix_path = os.path.join(directory, "embeddings.f32")
+        self._lock = threading.Lock()
+        self._model = None
+        self._tokenizer = None
+        self._conn = sqlite3.connect(
+            os.path.join(directory, "index.db"), timeout=60, check_same_thread=False
+        )
+        with self._conn:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS rows (hash TEXT PRIMARY KEY, row INTEGER);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                """
+            )
+        self.dim = None
+        self._load_dim()
+
+    def _load_dim(self):
+        # Another process may have stored the first embeddings since
+        if self.dim is None:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+            self.dim = int(row[0]) if row else None
+
+    def _load_model(self):
+        if self._model is None:
+            from transformers import AutoModel, AutoTokenizer
+
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            self._model = AutoModel.from_pretrained(self.model_name).eval()
+
+    def encode(self, texts):
+        """Embed texts without caching; rows are L2-normalized float32."""
+        import torch
+
+        self._load_model()
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = self._tokenizer(
+                texts[start : start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=64,
+                return_tensors="pt",
+            )
+            with torch.no_grad():
+                hidden = self._model(**batch).last_hidden_state
+            # Mean pooling over real tokens
+            mask = batch["attention_mask"].unsqueeze(-1).float()
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            vectors.append(pooled.numpy().astype(np.float32))
+        return _normalize(np.vstack(vectors))
+
+    def _rows_for(self, hashes):
+        rows = {}
+        for start in range(0, len(hashes), _LOOKUP_CHUNK):
+            chunk = hashes[start : start + _LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows.update(
+                self._conn.execute(
+                    f"SELECT hash, row FROM rows WHERE hash IN ({placeholders})", chunk
+                ).fetchall()
+            )
+        return rows
+
+    def _row_count(self):
+        if self.dim is None or not os.path.exists(self._matrix_path):
+            return 0
+        return os.path.getsize(self._matrix_path) // (4 * self.dim)
+
+    def rows(self, titles):
+        """Matrix rows of the titles' embeddings (see matrix), embedding only unseen titles."""
+        hashes = [_title_hash(title) for title in titles]
+        with self._lock:
+            self._load_dim()
+            rows = self._rows_for(list(set(hashes)))
+            missing = {}
+            for title, title_hash in zip(titles, hashes):
+                if title_hash not in rows:
+                    missing.setdefault(title_hash, title)
+
+            if missing:
+                logging.info(f"Embedding {len(missing)} new titles")
+                vectors = dict(zip(missing, self.encode(list(missing.values()))))
+                # The write transaction serializes appends across processes; titles
+                # another process stored while these were encoded are skipped
+                with self._conn:
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    rows.update(self._rows_for(list(missing)))
+                    new_hashes = [h for h in missing if h not in rows]
+                    self._load_dim()
+                    if self.dim is None:
+                        self.dim = next(iter(vectors.values())).shape[0]
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)",
+                            (str(self.dim),),
+                        )
+                    first_row = self._row_count()
+                    with open(self._matrix_path, "ab") as f:
+                        for h in new_hashes:
+                            f.write(vectors[h].tobytes())
+                    new_rows = {h: first_row + i for i, h in enumerate(new_hashes)}
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO rows (hash, row) VALUES (?, ?)",
+                        new_rows.items(),
+                    )
+                rows.update(new_rows)
+
+            return np.array([rows[h] for h in hashes], dtype=np.int64)
+
+    def matrix(self):
+        """
+        Read-only memory map of every cached embedding. Processes share its
+        pages through the OS page cache instead of each holding a copy.
+        """
+        self._load_dim()
+        if self.dim is None or not self._row_count():
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(
+            self._matrix_path, dtype=np.float32, mode="r", shape=(self._row_count(), self.dim)
+        )
+
+    def embed(self, titles):
+        """Return an (n, dim) float32 matrix for titles, embedding only unseen ones."""
+        rows = self.rows(titles)
+        if not len(rows):
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.asarray(self.matrix()[rows])
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_embedding_store():
+    """Shared embedding store; the model is loaded on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EmbeddingStore(EMBEDDING_DIR, EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE)
+        return _store
+
+
+def kmeans(X, k, max_iter=50, batch_size=None, seed=42):
+    """
+    Spherical k-means over L2-normalized rows, with k-means++ initialization.
+    With batch_size set, centroids are updated from random mini-batches.
+    Returns (centroids, labels).
+    """
+    rng = np.random.default_rng(seed)
+    n = X.shape[0]
+    k = min(k, n)
+
+    # k-means++ seeding on a sample
+    sample = X[rng.choice(n, min(n, 10000), replace=False)]
+    centroids = [sample[rng.integers(len(sample))]]
+    distance = np.clip(1 - sample @ centroids[0], 0, None)
+    for _ in range(1, k):
+        total = distance.sum()
+        probabilities = distance / total if total > 0 else None
+        centroid = sample[rng.choice(len(sample), p=probabilities)]
+        centroids.append(centroid)
+        distance = np.minimum(distance, np.clip(1 - sample @ centroid, 0, None))
+    centroids = np.stack(centroids)
+
+    if batch_size:
+        seen = np.zeros(k)
+        for _ in range(max_iter):
+            batch = X[rng.choice(n, min(batch_size, n), replace=False)]
+            labels = (batch @ centroids.T).argmax(axis=1)
+            counts = np.bincount(labels, minlength=k)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, batch)
+            seen += counts
+            updated = counts > 0
+            rate = (counts[updated] / seen[updated])[:, None]
+            centroids[updated] = (1 - rate) * centroids[updated] + rate * (
+                sums[updated] / counts[updated][:, None]
+            )
+            centroids = _normalize(centroids)
+    else:
+        for _ in range(max_iter):
+            labels = (X @ centroids.T).argmax(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, X)
+            empty = np.bincount(labels, minlength=k) == 0
+            sums[empty] = centroids[empty]
+            updated = _normalize(sums)
+            if np.allclose(updated, centroids, atol=1e-5):
+                break
+            centroids = updated
+
+    labels = (X @ centroids.T).argmax(axis=1)
+    return centroids, labels
+
+
+def cluster_titles(titles, embeddings, n_clusters=5, examples=10, counts=None):
+    """
+    Group titles into semantic clusters with their most central example titles.
+    counts gives each title's number of occurrences for the cluster sizes.
+    """
+    if len(titles) < n_clusters:
+        return []
+    batch_size = 4096 if len(titles) > IVF_THRESHOLD else None
+    centroids, labels = kmeans(embeddings, n_clusters, batch_size=batch_size)
+    similarity = (embeddings * centroids[labels]).sum(axis=1)
+
+    clusters = []
+    for cluster_idx in range(len(centroids)):
+        members = np.flatnonzero(labels == cluster_idx)
+        if not len(members):
+            continue
+        central = members[np.argsort(-similarity[members])[:examples]]
+        clusters.append(
+            {
+                "topic": f"Cluster {cluster_idx + 1}",
+                "documents": int(len(members) if counts is None else sum(counts[i] for i in members)),
+                "examples": [titles[i] for i in central],
+            }
+        )
+    clusters.sort(key=lambda cluster: -cluster["documents"])
+    return clusters
+
+
+def format_clusters(clusters):
+    """Render clusters as the raw topic summary sent to the LLM."""
+    lines = []
+    for cluster in clusters:
+        lines.append(f"{cluster['topic']} ({cluster['documents']} titles):")
+        lines.extend(f"- {example}" for example in cluster["examples"])
+    return "\n".join(lines) + "\n"
+
+
+def index_path(titles):
+    """Where the semantic_topics job saves the SemanticIndex of a title list."""
+    digest = hashlib.sha1("\n".join(titles).encode("utf-8")).hexdigest()
+    return os.path.join(get_embedding_store().directory, "indexes", f"{digest}.npz")
+
+
+class SemanticIndex:
+    """
+    Top-k retrieval of titles by cosine similarity: brute force for small sets,
+    inverted-file (IVF) partitions probed around the query above IVF_THRESHOLD.
+    Embeddings are read by row from the store's memory map rather than copied,
+    and the IVF partitions are built by the semantic_topics job (see save/load).
+    """
+
+    def __init__(self, titles, rows, matrix, centroids=None, order=None, bounds=None):
+        self.titles = titles
+        self.rows = rows
+        self.matrix = matrix
+        self.centroids = centroids
+        self.order = order
+        self.bounds = bounds
+
+    @classmethod
+    def build(cls, titles, embeddings=None):
+        """Index titles; embeddings, if already loaded, saves rereading them for IVF."""
+        store = get_embedding_store()
+        rows = store.rows(titles)
+        centroids = order = bounds = None
+        if len(titles) > IVF_THRESHOLD:
+            if embeddings is None:
+                embeddings = np.asarray(store.matrix()[rows])
+            n_lists = int(np.sqrt(len(titles)))
+            centroids, labels = kmeans(embeddings, n_lists, max_iter=20, batch_size=4096)
+            order = np.argsort(labels, kind="stable")
+            bounds = np.searchsorted(labels[order], np.arange(n_lists + 1))
+        return cls(titles, rows, store.matrix(), centroids, order, bounds)
+
+    def save(self, path):
+        """Write the row numbers and IVF partitions; older saved indexes are pruned."""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        arrays = {"rows": self.rows}
+        if self.centroids is not None:
+            arrays.update(centroids=self.centroids, order=self.order, bounds=self.bounds)
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+        # Sessions load an index soon after its job finishes; stale ones only take space
+        for name in os.listdir(directory):
+            other = os.path.join(directory, name)
+            try:
+                if time.time() - os.path.getmtime(other) > JOB_RESULT_TTL:
+                    os.remove(other)
+            except OSError:
+                pass
+
+    @classmethod
+    def load(cls, path, titles):
+        """Index saved by save() for the same titles, over the shared memory map."""
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        return cls(
+            titles,
+            arrays["rows"],
+            get_embedding_store().matrix(),
+            arrays.get("centroids"),
+            arrays.get("order"),
+            arrays.get("bounds"),
+        )
+
+    def search(self, query_vector, k=50, n_probe=8):
+        """Indices of the k titles most similar to query_vector, best first."""
+        if self.order is not None:
+            probe = np.argsort(-(self.centroids @ query_vector))[:n_probe]
+            candidates = np.concatenate(
+                [self.order[self.bounds[i] : self.bounds[i + 1]] for i in probe]
+            )
+        else:
+            candidates = np.arange(len(self.titles))
+        k = min(k, len(candidates))
+        if k == 0:
+            return []
+        scores = np.empty(len(candidates), dtype=np.float32)
+        for start in range(0, len(candidates), _SCORE_CHUNK):
+            chunk = candidates[start : start + _SCORE_CHUNK]
+            scores[start : start + len(chunk)] = self.matrix[self.rows[chunk]] @ query_vector
+        top = np.argpartition(-scores, k - 1)[:k]
+        return candidates[top[np.argsort(-scores[top])]].tolist()
+
+    def search_text(self, question, k=50):
+        """The k titles most relevant to a question."""
+        query_vector = get_embedding_store().encode([question])[0]
+        return [self.titles[i] for i in self.search(query_vector, k)]
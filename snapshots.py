@@ -0,0 +1,223 @@
+"""
+Per-day topic model snapshots, merged to answer topics for arbitrary ranges.
+
+Usage:
+    python snapshots.py --start 2024-01-01 --end 2024-12-31
+"""
+
+import argparse
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+from cloud_config import (
+    SNAPSHOT_DIR,
+    COSMOS_PAGE_SIZE,
+    TITLE_MAX_CHARS,
+    get_container,
+    get_local_store,
+    local_store,
+)
+from pipeline import iter_documents, iter_truncated, iter_preprocessed
+
+# Topics fitted per day, and terms kept per daily topic
+DAILY_TOPICS = 5
+DAILY_TOP_TERMS = 50
+
+
+def _day_bounds(day):
+    return f"{day.isoformat()}T00:00:00.000000Z", f"{day.isoformat()}T23:59:59.999999Z"
+
+
+def _path(day):
+    return os.path.join(SNAPSHOT_DIR, f"{day.isoformat()}.json")
+
+
+def load_snapshot(day):
+    try:
+        with open(_path(day), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def build_snapshot(day, titles, fingerprint=None):
+    """Summarize one day's titles into term counts and NMF topic factors."""
+    import numpy as np
+    from sklearn.decomposition import NMF
+    from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+
+    documents = list(iter_preprocessed(titles))
+    snapshot = {
+        "day": day.isoformat(),
+        "documents": len(documents),
+        "fingerprint": fingerprint,
+        "term_counts": {},
+        "topics": [],
+    }
+    if len(documents) < 2:
+        return snapshot
+
+    try:
+        vectorizer = CountVectorizer(
+            stop_words="english", ngram_range=(1, 2), max_features=1000
+        )
+        counts = vectorizer.fit_transform(documents)
+    except ValueError:
+        # Only stopwords left for the day
+        return snapshot
+    terms = vectorizer.get_feature_names_out()
+    term_totals = np.asarray(counts.sum(axis=0)).ravel()
+    snapshot["term_counts"] = {
+        terms[i]: int(term_totals[i]) for i in np.flatnonzero(term_totals)
+    }
+
+    n_topics = min(DAILY_TOPICS, counts.shape[0] - 1, counts.shape[1] - 1)
+    if n_topics < 1:
+        return snapshot
+    tfidf = TfidfTransformer().fit_transform(counts)
+    nmf = NMF(n_components=n_topics, init="nndsvda", tol=1e-3, max_iter=300, random_state=42)
+    nmf.fit(tfidf)
+    for topic in nmf.components_:
+        top = topic.argsort()[: -DAILY_TOP_TERMS - 1 : -1]
+        top = [i for i in top if topic[i] > 0]
+        snapshot["topics"].append(
+            {"terms": [terms[i] for i in top], "weights": [float(topic[i]) for i in top]}
+        )
+    return snapshot
+
+
+def _iter_day_titles(container, day):
+    start_ts, end_ts = _day_bounds(day)
+    store = get_local_store()
+    if store is not None:
+        docs = store.iter_range(start_ts, end_ts)
+    else:
+        query = f"SELECT c.ChatTitle FROM c WHERE c.TimeStamp BETWEEN '{start_ts}' AND '{end_ts}'"
+        docs = iter_documents(container, query, page_size=COSMOS_PAGE_SIZE)
+    return (doc["ChatTitle"] for doc in iter_truncated(docs, TITLE_MAX_CHARS))
+
+
+def refresh_snapshots(container, start_day, end_day, force=False):
+    """
+    Build snapshots for closed days in [start_day, end_day] that are missing or,
+    when the local store is available, whose data changed since they were built.
+    Returns the days that were (re)built.
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    if local_store is not None:
+        local_store.sync_if_stale(container)
+
+    last_closed_day = date.today() - timedelta(days=1)
+    built = []
+    day = start_day
+    while day <= min(end_day, last_closed_day):
+        fingerprint = None
+        if get_local_store() is not None:
+            fingerprint = get_local_store().fingerprint(*_day_bounds(day))
+        existing = None if force else load_snapshot(day)
+        if existing is None or (
+            fingerprint is not None and existing.get("fingerprint") != fingerprint
+        ):
+            snapshot = build_snapshot(day, _iter_day_titles(container, day), fingerprint)
+            with open(_path(day), "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+            built.append(day)
+        day += timedelta(days=1)
+    return built
+
+
+def merge_topics(snapshots, max_topics=5, max_top_words=10):
+    """
+    Merge daily topic factors into range-level topics, in the structure returned by
+    topicmodelling_dev.fit_topics. Days are weighted by their document counts.
+    """
+    import numpy as np
+    from scipy.sparse import csr_matrix
+    from sklearn.decomposition import NMF
+
+    total_documents = sum(snapshot["documents"] for snapshot in snapshots)
+    if not total_documents:
+        return []
+
+    vocabulary = {}
+    rows, cols, values = [], [], []
+    row = 0
+    for snapshot in snapshots:
+        share = snapshot["documents"] / total_documents
+        for topic in snapshot["topics"]:
+            for term, weight in zip(topic["terms"], topic["weights"]):
+                rows.append(row)
+                cols.append(vocabulary.setdefault(term, len(vocabulary)))
+                values.append(weight * share)
+            row += 1
+    if row < 2 or len(vocabulary) < 2:
+        return []
+
+    matrix = csr_matrix((values, (rows, cols)), shape=(row, len(vocabulary)))
+    n_topics = min(max_topics, row - 1, len(vocabulary) - 1)
+    nmf = NMF(n_components=n_topics, init="nndsvda", tol=1e-3, max_iter=300, random_state=42)
+    nmf.fit(matrix)
+
+    terms = np.empty(len(vocabulary), dtype=object)
+    for term, index in vocabulary.items():
+        terms[index] = term
+
+    topics = []
+    for topic_idx, topic in enumerate(nmf.components_):
+        top_features_ind = topic.argsort()[: -max_top_words - 1 : -1]
+        weights = topic[top_features_ind]
+        weights = weights / weights.sum()
+        topics.append(
+            {
+                "topic": f"Topic {topic_idx + 1}",
+                "score": float(sum(weights)),
+                "keywords": [
+                    {"term": terms[i], "weight": float(weight)}
+                    for i, weight in zip(top_features_ind, weights)
+                ],
+            }
+        )
+    return topics
+
+
+def range_topics(start_day, end_day, max_topics=5, max_top_words=10):
+    """Topics for a date range from daily snapshots, or None if any day is missing."""
+    snapshots = []
+    day = start_day
+    while day <= end_day:
+        snapshot = load_snapshot(day)
+        if snapshot is None:
+            return None
+        snapshots.append(snapshot)
+        day += timedelta(days=1)
+    return merge_topics(snapshots, max_topics, max_top_words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build per-day topic snapshots.")
+    parser.add_argument("--start", help="First day (YYYY-MM-DD), default 90 days ago")
+    parser.add_argument("--end", help="Last day (YYYY-MM-DD), default yesterday")
+    parser.add_argument("--force", action="store_true", help="Rebuild existing snapshots")
+    args = parser.parse_args()
+
+    today = date.today()
+    start_day = (
+        datetime.strptime(args.start, "%Y-%m-%d").date()
+        if args.start
+        else today - timedelta(days=90)
+    )
+    end_day = (
+        datetime.strptime(args.end, "%Y-%m-%d").date()
+        if args.end
+        else today - timedelta(days=1)
+    )
+
+    built = refresh_snapshots(get_container(), start_day, end_day, force=args.force)
+    print(f"Built {len(built)} snapshots in {SNAPSHOT_DIR}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,84 @@
+"""
+Measure cold import time of the app's modules against a budget.
+
+Usage:
+    python startup_budget.py [--budget-ms 500]
+"""
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def app_modules(path=os.path.join(ROOT, "app.py")):
+    """
+    This repository's modules that app.py imports at startup (module level),
+    in import order; streamlit and other installed packages are excluded.
+    """
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            top = name.split(".")[0]
+            if os.path.exists(os.path.join(ROOT, f"{top}.py")) and top not in modules:
+                modules.append(top)
+    return modules
+
+
+def measure_import_times(modules=None):
+    """
+    Import modules (default: app_modules()) in a fresh interpreter and return
+    {module: cumulative microseconds}.
+    """
+    modules = modules or app_modules()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    times = {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.strip() in modules and not name.startswith("  "):
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check app import time against a budget.")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=float(os.getenv("IMPORT_BUDGET_MS", "500")),
+        help="Maximum total import time in milliseconds",
+    )
+    args = parser.parse_args()
+
+    times = measure_import_times()
+    for name, micros in sorted(times.items(), key=lambda item: -item[1]):
+        print(f"{name:>20}: {micros / 1000:8.1f} ms")
+    total_ms = sum(times.values()) / 1000
+    print(f"{'total':>20}: {total_ms:8.1f} ms (budget {args.budget_ms:.0f} ms)")
+    sys.exit(0 if total_ms <= args.budget_ms else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from cloud_config import get_llm_client, LLM_CHUNK_TOKENS, LLM_MAP_CONCURRENCY
+from prompts import choose_model, count_tokens
+
+# Reduce levels before the remaining partials are forced into a single call
+MAX_REDUCE_DEPTH = 3
+
+
+def chunk_texts(texts, max_tokens):
+    """Group texts, in order, into chunks whose token count stays within max_tokens."""
+    chunks = []
+    current, current_tokens = [], 0
+    for text in texts:
+        tokens = count_tokens(text) + 1  # separator
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _complete(messages, model, temperature, **options):
+    response = get_llm_client().chat.completions.create(
+        model=model or choose_model(messages),
+        messages=messages,
+        temperature=temperature,
+        stream=False,
+        **options,
+    )
+    return response.choices[0].message.content.strip()
+
+
+def map_reduce(
+    titles,
+    map_messages,
+    reduce_messages,
+    model=None,
+    temperature=0.7,
+    max_chunk_tokens=LLM_CHUNK_TOKENS,
+    concurrency=LLM_MAP_CONCURRENCY,
+    progress=None,
+    **options,
+):
+    """
+    Summarize titles that may not fit in one prompt. Titles are split into
+    token-budgeted chunks, each chunk is summarized in parallel with
+    map_messages(text), and the partial summaries are merged with
+    reduce_messages(text). Ranges that fit in one chunk cost a single call.
+    Without a model, each call's model tier is chosen by its prompt size.
+    progress, if given, is called with a status message as chunks complete.
+    """
+    chunks = chunk_texts(titles, max_chunk_tokens)
+    if not chunks:
+        return ""
+    if len(chunks) == 1:
+        return _complete(map_messages("\n".join(chunks[0])), model, temperature, **options)
+
+    def run(build_messages, text):
+        return _complete(build_messages(text), model, temperature, **options)
+
+    completed = 0
+    completed_lock = threading.Lock()
+
+    def run_chunk(chunk):
+        nonlocal completed
+        summary = run(map_messages, "\n".join(chunk))
+        if progress:
+            with completed_lock:
+                completed += 1
+                progress(f"Summarized {completed} of {len(chunks)} chunks")
+        return summary
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        with tracing.span("llm_map", chunks=len(chunks)):
+            # bind() keeps the pool's LLM counters on this span
+            partials = list(executor.map(tracing.bind(run_chunk), chunks))
+
+        with tracing.span("llm_reduce"):
+            # Merge partial summaries, in several rounds if they still exceed the budget
+            for _ in range(MAX_REDUCE_DEPTH):
+                groups = chunk_texts(partials, max_chunk_tokens)
+                if len(groups) == 1:
+                    break
+                partials = list(
+                    executor.map(
+                        tracing.bind(lambda group: run(reduce_messages, "\n\n".join(group))),
+                        groups,
+                    )
+                )
+
+            return run(reduce_messages, "\n\n".join(partials))
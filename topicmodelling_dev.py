@@ -1,157 +1,378 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.decomposition import NMF
 import logging
-import re
 import json
-import os
-from openai import AzureOpenAI
-from preprocessor import preprocess_text
+import tracing
+from cloud_config import get_llm_client, LLM_JSON_RETRIES, LLM_LARGE_MODEL, TOPIC_SAMPLE_TOKENS
+from preprocessor import preprocess_titles
+from prompts import compact_prompt, fit_titles
 
+# scikit-learn and numpy are imported on first use to keep app startup fast
 
-# Initialize Azure OpenAI client
-llmclient = AzureOpenAI(
-    azure_endpoint=os.getenv("LLM_ENDPOINT"),
-    api_key=os.getenv("LLM_KEY"),
-    api_version="2024-10-01-preview",
-)
+# Title counts above which NMF is fitted in mini-batches
+MINIBATCH_THRESHOLD = 20000
 
+# Refit the shared vocabulary when more of the new titles' terms fall outside it
+# than fell outside it on the corpus it was fitted on, by more than this share
+MAX_UNSEEN_TERMS_INCREASE = 0.05
+
+# Vectorizer fitted on an earlier corpus and the share of that corpus' terms
+# outside its vocabulary, reused while the vocabulary still fits new titles
+_vectorizer = None
+_vectorizer_unseen = 0.0
+
+
+def _unseen_share(vectorizer, documents):
+    """Share of the documents' terms (after stop words and n-grams) outside the vocabulary."""
+    analyze = vectorizer.build_analyzer()
+    vocabulary = vectorizer.vocabulary_
+    total = unseen = 0
+    for doc in documents:
+        terms = analyze(doc)
+        total += len(terms)
+        unseen += sum(term not in vocabulary for term in terms)
+    return unseen / max(total, 1)
+
+
+def _vectorize(documents, refit=False):
+    """
+    TF-IDF one document per title, reusing the shared vocabulary while the
+    titles' terms fit it about as well as the corpus it was fitted on. Refit
+    vectorizers (refit=True) are used for their call only and never replace
+    the shared one, so one-off fits cannot change later results.
+    """
+    global _vectorizer, _vectorizer_unseen
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    if _vectorizer is not None and not refit:
+        unseen = _unseen_share(_vectorizer, documents)
+        if unseen <= _vectorizer_unseen + MAX_UNSEEN_TERMS_INCREASE:
+            return _vectorizer, _vectorizer.transform(documents)
+
+    vectorizer = TfidfVectorizer(
+        stop_words="english",
+        max_df=0.85,
+        min_df=2,
+        ngram_range=(1, 2),
+        max_features=1000,
+    )
+    tfidf = vectorizer.fit_transform(documents)
+    if not refit:
+        _vectorizer = vectorizer
+        _vectorizer_unseen = _unseen_share(vectorizer, documents)
+    return vectorizer, tfidf
+
+
+def fit_topics(
+    titles, max_topics=5, max_top_words=10, refit=False, preprocessed=False, counts=None
+):
+    """
+    Fit NMF topics over one document per title. Returns (topics, doc_topic), where
+    doc_topic is the title-by-topic weight matrix with one row per input title
+    (zeros for titles left empty by preprocessing); topics are empty when there is
+    too little text. Pass preprocessed=True for titles that are already cleaned,
+    and counts for titles compacted into unique (title, count) pairs.
+    """
+    import numpy as np
+    from sklearn.decomposition import NMF
 
-def extract_topics_from_text(text, max_topics=5, max_top_words=10):
-    """Extract topics using NMF and return structured topic data in JSON format."""
     try:
-        cleaned_text = preprocess_text(text)
-        if len(cleaned_text.split()) < 10:
-            logging.warning("Text too short for meaningful topic extraction")
-            return []
+        from sklearn.decomposition import MiniBatchNMF
+    except ImportError:  # scikit-learn < 1.1
+        MiniBatchNMF = None
 
-        vectorizer = TfidfVectorizer(
-            stop_words="english",
-            max_df=0.85,
-            min_df=2,
-            ngram_range=(1, 2),
-            max_features=1000,
-        )
+    titles = list(preprocess_titles(titles, cache=True) if not preprocessed else titles)
+    counts = [1] * len(titles) if counts is None else list(counts)
+    kept_index = [index for index, doc in enumerate(titles) if doc]
+    kept = [(titles[index], counts[index]) for index in kept_index]
+    documents = [doc for doc, _ in kept]
+    counts = np.array([count for _, count in kept], dtype=float)
+    if sum(len(doc.split()) * count for doc, count in kept) < 10:
+        logging.warning("Text too short for meaningful topic extraction")
+        return [], None
 
-        # Split text into sentences or chunks
-        sentences = text.split(".")
-        if len(sentences) < 3:
-            sentences = [
-                text[i : i + 100]
-                for i in range(0, len(text), 100)
-                if len(text[i : i + 100].strip()) > 0
-            ]
+    with tracing.span("vectorize", documents=len(documents)) as vectorize_span:
+        vectorizer, tfidf = _vectorize(documents, refit=refit)
+        if counts.size and counts.max() > 1:
+            # Repeated titles weigh in with sqrt(count) instead of one row per copy
+            tfidf = tfidf.multiply(np.sqrt(counts)[:, None]).tocsr()
+        vectorize_span.set(features=tfidf.shape[1])
 
-        tfidf = vectorizer.fit_transform(sentences)
+    if tfidf.shape[1] < 2:
+        logging.warning("Not enough features extracted for NMF")
+        return [], None
 
-        if tfidf.shape[1] < 2:
-            logging.warning("Not enough features extracted for NMF")
-            return []
+    n_topics = min(max_topics, tfidf.shape[1] - 1)
 
-        n_topics = min(max_topics, min(5, tfidf.shape[1] - 1))
+    minibatch = MiniBatchNMF is not None and tfidf.shape[0] > MINIBATCH_THRESHOLD
+    if minibatch:
+        nmf = MiniBatchNMF(
+            n_components=n_topics, init="nndsvda", batch_size=2048, random_state=42
+        )
+    else:
+        nmf = NMF(n_components=n_topics, init="nndsvda", tol=1e-3, max_iter=300, random_state=42)
 
-        nmf = NMF(n_components=n_topics, random_state=42, max_iter=500, l1_ratio=0.5)
+    with tracing.span("nmf_fit", topics=n_topics, minibatch=minibatch):
+        doc_topic = nmf.fit_transform(tfidf)
+    feature_names = vectorizer.get_feature_names_out()
 
-        nmf_result = nmf.fit_transform(tfidf)
-        feature_names = vectorizer.get_feature_names_out()
+    # Titles per topic, assigning each title with any known terms to its strongest topic
+    has_terms = doc_topic.sum(axis=1) > 0
+    assigned = doc_topic[has_terms].argmax(axis=1)
+    volumes = np.bincount(assigned, weights=counts[has_terms], minlength=n_topics)
 
-        topics = []
-        for topic_idx, topic in enumerate(nmf.components_):
-            top_features_ind = topic.argsort()[: -max_top_words - 1 : -1]
-            top_features = [feature_names[i] for i in top_features_ind]
+    topics = []
+    for topic_idx, topic in enumerate(nmf.components_):
+        top_features_ind = topic.argsort()[: -max_top_words - 1 : -1]
+        top_features = [feature_names[i] for i in top_features_ind]
 
-            weights = topic[top_features_ind]
-            weights = weights / weights.sum()
+        weights = topic[top_features_ind]
+        weights = weights / weights.sum()
 
-            weighted_terms = [
-                {"term": feature, "weight": float(weight)}
-                for feature, weight in zip(top_features, weights)
-            ]
+        weighted_terms = [
+            {"term": feature, "weight": float(weight)}
+            for feature, weight in zip(top_features, weights)
+        ]
+
+        topics.append(
+            {
+                "topic": f"Topic {topic_idx + 1}",
+                "score": float(sum(weights)),
+                "documents": int(volumes[topic_idx]),
+                "keywords": weighted_terms,
+            }
+        )
+
+    full_doc_topic = np.zeros((len(titles), n_topics), dtype=doc_topic.dtype)
+    full_doc_topic[kept_index] = doc_topic
+    return topics, full_doc_topic
 
-            topics.append(
-                {
-                    "topic": f"Topic {topic_idx + 1}",
-                    "score": float(sum(weights)),
-                    "keywords": weighted_terms,
-                }
-            )
 
-        topic_analysis = ""
-        for topic_item in topics:
+def format_topics(topics):
+    """Render structured topics as the keyword summary sent to the LLM."""
+    topic_analysis = ""
+    for topic_item in topics:
+        topic_analysis += (
+            f"Topic {topic_item['topic']} (score: {topic_item['score']:.2f}):\n"
+        )
+        for keyword in topic_item["keywords"]:
             topic_analysis += (
-                f"Topic {topic_item['topic']} (score: {topic_item['score']:.2f}):\n"
+                f"- {keyword['term']} (weight: {keyword['weight']:.2f})\n"
             )
-            for keyword in topic_item["keywords"]:
-                topic_analysis += (
-                    f"- {keyword['term']} (weight: {keyword['weight']:.2f})\n"
-                )
+    return topic_analysis
+
 
-        return interpret_topics_with_llm(text, topic_analysis)
+def extract_topics(
+    titles, max_topics=5, max_top_words=10, preprocessed=False, counts=None, on_topic=None
+):
+    """
+    Extract NMF topics from an iterable of chat titles and label them with the
+    LLM; on_topic is called with each label as it arrives.
+    """
+    try:
+        titles = list(titles)
+        topics, _ = fit_topics(
+            titles, max_topics, max_top_words, preprocessed=preprocessed, counts=counts
+        )
+        if not topics:
+            return []
+        return interpret_topics_with_llm(
+            "\n".join(titles), format_topics(topics), on_topic=on_topic
+        )
 
     except Exception as e:
         logging.error(f"Error extracting topics: {e}")
         return []
 
 
-def interpret_topics_with_llm(text, raw_topics):
+def extract_topics_from_text(text, max_topics=5, max_top_words=10):
+    """Extract topics from newline-separated chat titles."""
+    return extract_topics(
+        (line for line in text.split("\n") if line.strip()), max_topics, max_top_words
+    )
+
+
+# Structured output for topic labels; "topic" is the number of the raw topic
+TOPICS_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "topics",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "topics": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "topic": {"type": "integer"},
+                            "label": {"type": "string"},
+                            "description": {"type": "string"},
+                        },
+                        "required": ["topic", "label", "description"],
+                        "additionalProperties": False,
+                    },
+                }
+            },
+            "required": ["topics"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+def split_raw_topics(raw_topics):
+    """Split a raw topic summary into one block per topic (a heading plus its "- " lines)."""
+    blocks = []
+    for line in raw_topics.splitlines():
+        if not line.strip():
+            continue
+        if blocks and line.lstrip().startswith("- "):
+            blocks[-1] += "\n" + line
+        else:
+            blocks.append(line)
+    return blocks
+
+
+def iter_array_objects(fragments):
     """
-    Use LLM to interpret raw topics and return structured interpretations in JSON format.
+    Parse the objects inside JSON arrays from streamed text fragments, yielding
+    each one as soon as it closes. Objects that fail to parse are skipped.
     """
-    try:
-        prompt = f"""
-        Analyze the following text and the extracted topic keywords to identify the main themes and topics.
-
-        Text excerpt: {text[:1000]}... (truncated for brevity)
-        
-        Raw extracted topics:
-        {raw_topics}
-        
-        Return a JSON array of topic objects with the following structure:
-        [
-            {{
-                "label": "Clear topic name",
-                "description": "Brief 1-2 sentence description of the topic"
-            }},
-            ...
-        ]
-        
-        Ensure your response can be parsed as valid JSON. Return ONLY the JSON array and nothing else.
-        """
-
-        response = llmclient.chat.completions.create(
-            model="gpt-4.1",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a topic analysis expert who can identify meaningful themes and topics from text and return them in valid JSON format.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.3,
-        )
+    stack, buffer = [], []
+    in_string = escaped = False
+    for fragment in fragments:
+        for char in fragment:
+            if buffer:
+                buffer.append(char)
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in "[{":
+                if char == "{" and not buffer and stack and stack[-1] == "[":
+                    buffer = [char]
+                    depth = len(stack)
+                stack.append(char)
+            elif char in "]}" and stack:
+                stack.pop()
+                if buffer and len(stack) == depth:
+                    try:
+                        yield json.loads("".join(buffer))
+                    except json.JSONDecodeError:
+                        pass
+                    buffer = []
 
-        interpreted_content = response.choices[0].message.content
 
-        # Try to parse the response as JSON
+def validate_topic(item, expected):
+    """item as {"topic", "label", "description"} if it labels one of the expected topic numbers, else None."""
+    if not isinstance(item, dict):
+        return None
+    topic, label, description = item.get("topic"), item.get("label"), item.get("description")
+    if type(topic) is not int or topic not in expected:
+        return None
+    if not isinstance(label, str) or not label.strip() or not isinstance(description, str):
+        return None
+    return {"topic": topic, "label": label.strip(), "description": description.strip()}
+
+
+def _labels_complete(numbers):
+    """Response check: true when content validly labels every one of numbers."""
+
+    def validate(content):
         try:
-            parsed_topics = json.loads(interpreted_content)
-            return parsed_topics
-        except json.JSONDecodeError:
-            # If direct parsing fails, try to extract JSON from the response
-            json_pattern = r"\[[\s\S]*\]"
-            match = re.search(json_pattern, interpreted_content)
-            if match:
-                try:
-                    json_str = match.group(0)
-                    parsed_topics = json.loads(json_str)
-                    return parsed_topics
-                except json.JSONDecodeError:
-                    pass
-
-            # Fallback: return a basic structure with the raw content
-            logging.warning(
-                "Failed to parse LLM response as JSON, returning raw content"
-            )
-            return [{"label": "Topic analysis", "description": interpreted_content}]
+            items = json.loads(content).get("topics")
+        except (json.JSONDecodeError, AttributeError):
+            return False
+        if not isinstance(items, list):
+            return False
+        topics = (validate_topic(item, set(numbers)) for item in items)
+        return {topic["topic"] for topic in topics if topic} == set(numbers)
+
+    return validate
+
+
+def _stream_topics(excerpt, blocks, numbers, cache=True):
+    """
+    Stream labels for the numbered raw topic blocks, yielding raw parsed
+    objects. Only responses labeling every block are cached.
+    """
+    numbered_topics = "\n".join(f"[{number}] {blocks[number - 1]}" for number in numbers)
+    prompt = compact_prompt(f"""
+    Analyze the following text and the extracted topic keywords to identify the main themes and topics.
+
+    Text excerpt:
+    {excerpt}
+
+    Raw extracted topics, each with its number in brackets:
+    {numbered_topics}
+
+    For each raw topic, return its number as "topic", a clear topic name as "label"
+    and a brief 1-2 sentence description of the topic as "description".
+    """)
+    response_stream = get_llm_client().chat.completions.create(
+        model=LLM_LARGE_MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": "You are a topic analysis expert who can identify meaningful themes and topics from text.",
+            },
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.3,
+        response_format=TOPICS_SCHEMA,
+        stream=True,
+        cache=cache,
+        validate=_labels_complete(numbers),
+    )
+    fragments = (
+        chunk.choices[0].delta.content or ""
+        for chunk in response_stream
+        if chunk.choices
+    )
+    yield from iter_array_objects(fragments)
+
+
+def interpret_topics_with_llm(text, raw_topics, on_topic=None):
+    """
+    Use LLM to label raw topics, returning [{"topic", "label", "description"}]
+    in raw topic order. The response is a schema-constrained stream: each topic
+    is validated as soon as it is complete and passed to on_topic, if given.
+    Topics missing or malformed in the response are requested again, alone,
+    up to LLM_JSON_RETRIES times.
+    """
+    try:
+        # An even spread of the titles within a fixed token budget
+        excerpt = "\n".join(fit_titles(text.splitlines(), TOPIC_SAMPLE_TOKENS))
+        blocks = split_raw_topics(raw_topics)
+        labeled = {}
+        pending = list(range(1, len(blocks) + 1))
+
+        with tracing.span("llm_interpret", topics=len(blocks)) as interpret_span:
+            for attempt in range(LLM_JSON_RETRIES + 1):
+                if not pending:
+                    break
+                if attempt:
+                    interpret_span.add(retries=1, retried_topics=len(pending))
+                    logging.warning(f"Re-requesting {len(pending)} malformed or missing topic labels")
+                # Retries skip the cache so a repeated prompt gets a fresh answer
+                for item in _stream_topics(excerpt, blocks, pending, cache=not attempt):
+                    topic = validate_topic(item, set(pending) - set(labeled))
+                    if topic is None:
+                        interpret_span.add(invalid_topics=1)
+                        continue
+                    labeled[topic["topic"]] = topic
+                    if on_topic:
+                        on_topic(topic)
+                pending = [number for number in pending if number not in labeled]
+
+        if pending:
+            logging.warning(f"No valid labels for topics {pending}")
+        return [labeled[number] for number in sorted(labeled)]
 
     except Exception as e:
         logging.error(f"Error interpreting topics with LLM: {e}")
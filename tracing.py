@@ -0,0 +1,165 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Trace and span of the running user action; copied into worker threads by bind()
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed stage with numeric counters and other attributes."""
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._lock = threading.Lock()
+
+    def add(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                self.attributes[name] = self.attributes.get(name, 0) + value
+
+    def set(self, **attributes):
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def to_dict(self):
+        """OpenTelemetry-style span record."""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "attributes": dict(self.attributes),
+        }
+
+
+class Trace:
+    """Spans recorded for one user action: a fetch, a chat answer or a job."""
+
+    def __init__(self, name):
+        self.name = name
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def _start(self, name, parent_id, attributes):
+        span = Span(name, self.trace_id, parent_id, attributes)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def to_dict(self):
+        with self._lock:
+            return {"trace": self.name, "spans": [span.to_dict() for span in self.spans]}
+
+
+def summarize(trace):
+    """One row per span of an exported trace: stage, duration and attributes."""
+    rows = []
+    for span in trace["spans"]:
+        end = span["end_time_unix_nano"] or time.time_ns()
+        duration_ms = (end - span["start_time_unix_nano"]) / 1e6
+        attributes = {
+            name: round(value, 1) if isinstance(value, float) else value
+            for name, value in span["attributes"].items()
+        }
+        rows.append({"stage": span["name"], "ms": round(duration_ms, 1), **attributes})
+    return rows
+
+
+@contextmanager
+def start_trace(name, log_path=None, **attributes):
+    """
+    Record a trace whose root span is name. With log_path set, the finished
+    trace is appended there as one JSON line.
+    """
+    trace = Trace(name)
+    root = trace._start(name, None, attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(root)
+    try:
+        yield trace
+    finally:
+        root.end_ns = time.time_ns()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        if log_path:
+            try:
+                with open(log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace.to_dict()) + "\n")
+            except OSError as e:
+                logging.warning(f"Could not write trace log: {e}")
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a stage as a child of the current span; a detached span outside any trace."""
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    if trace is None:
+        current = Span(name, None, attributes=attributes)
+    else:
+        current = trace._start(name, parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+
+
+def add(**counters):
+    """Add to numeric counters on the current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.add(**counters)
+
+
+def bind(fn):
+    """Wrap fn to run in a copy of the caller's context, e.g. in a thread pool."""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+def record_cosmos_page(items=0):
+    """Count a Cosmos DB page and its items on the current span."""
+    add(cosmos_pages=1, cosmos_items=items)
+
+
+def record_request_charge(headers, result):
+    """
+    response_hook for Cosmos DB queries: adds the request charge (RU) of each
+    response, including every partition of a cross-partition page, to the current span.
+    """
+    # query_items also calls the hook once with the pager and the client's shared
+    # (possibly another session's) headers; only responses with results count
+    if hasattr(result, "by_page"):
+        return
+    add(cosmos_ru=float((headers or {}).get("x-ms-request-charge", 0) or 0))
+
+
+def totals(traces, *names):
+    """Sum of the named numeric attributes over every span of exported traces."""
+    sums = dict.fromkeys(names, 0)
+    for trace in traces:
+        for span in trace["spans"]:
+            for name in names:
+                sums[name] += span["attributes"].get(name, 0)
+    return sums